@@ -0,0 +1,955 @@
+import hashlib
+import heapq
+import json
+import math
+import re
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import deque
+
+import numpy as np
+
+# cell types, stored one byte per cell
+EMPTY = 0
+BLOCK = 1
+TARGET = 2
+AGENT = 3
+CELL_TYPES = ['', 'BLOCK', 'TARGET', 'AGENT']
+TILE_TYPES = {'': EMPTY, 'BLOCK': BLOCK, 'TARGET': TARGET, 'AGENT': AGENT}
+
+# search marks, stored one byte per cell next to the cells
+UNVISITED = 0
+VISITED = 1
+VISITED_ALTERNATIVE = 2
+PATH = 3
+MARK_TYPES = ['', 'VISITED', 'VISITED_ALTERNATIVE', 'PATH']
+
+TILE_PATTERN = re.compile(
+    r'Tile\((?P<x>[0-9]+), (?P<y>[0-9]+), (?P<tile_type>[A-Z]+)\)')
+
+
+class Board:
+    """Headless copy of a board: one byte per cell, indexed by x * size + y."""
+
+    def __init__(self, size, cells=None):
+        self.size = size
+        self.cells = cells if cells is not None else bytearray(size * size)
+        self.graphs = {}  # diagonally -> Graph, built on the first search
+
+    def graph(self, diagonally=True) -> 'Graph':
+        # cells written directly since the last call are caught up with here
+        graph = self.graphs.get(diagonally)
+        if graph is None:
+            graph = self.graphs[diagonally] = Graph(self, diagonally)
+        else:
+            graph.sync()
+        return graph
+
+    def set_cell(self, index, cell):
+        # single cell edits patch the cached graphs right away
+        self.cells[index] = cell
+        for graph in self.graphs.values():
+            graph.update_cell(index)
+
+    def index(self, x, y) -> int:
+        return x * self.size + y
+
+    def coords(self, index) -> tuple[int, int]:
+        return divmod(index, self.size)
+
+    def targets(self) -> list[int]:
+        return [i for i, cell in enumerate(self.cells) if cell == TARGET]
+
+    @classmethod
+    def from_tiles(cls, tiles):
+        board = cls(len(tiles))
+        for x, line in enumerate(tiles):
+            for y, tile in enumerate(line):
+                board.cells[x * board.size + y] = TILE_TYPES.get(tile.tile_type, EMPTY)
+        return board
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, 'r') as board_file:
+            content = board_file.readlines()
+        board = cls(int(content.pop(0)))
+        for tile in content:
+            m = TILE_PATTERN.match(tile)
+            board.cells[board.index(int(m.group('x')), int(m.group('y')))] = \
+                TILE_TYPES[m.group('tile_type')]
+        return board
+
+    def save(self, filename):
+        names = {BLOCK: 'BLOCK', TARGET: 'TARGET', AGENT: 'AGENT'}
+        with open(filename, 'w') as board_file:
+            board_file.write(str(self.size) + '\n')
+            for i, cell in enumerate(self.cells):
+                if cell in names:
+                    x, y = self.coords(i)
+                    board_file.write(f'Tile({x}, {y}, {names[cell]})\n')
+
+
+class SearchResult:
+    def __init__(self, path, cost, expanded, elapsed, status, suboptimality=None, peak_nodes=None):
+        self.path = path  # cell indices from start to end, empty if not found
+        self.cost = cost
+        self.expanded = expanded
+        self.elapsed = elapsed
+        self.status = status  # 'found', 'no path', 'cancelled' or 'timeout'
+        # proven upper bound of cost / optimal cost, None when not known
+        self.suboptimality = suboptimality
+        # most nodes the search kept (in its open list, caches and dicts) at once
+        self.peak_nodes = peak_nodes
+        self.peak_bytes = None  # only set by measure_memory
+
+    @property
+    def found(self) -> bool:
+        return self.status == 'found'
+
+    def __repr__(self) -> str:
+        return '{}({}, cost={}, expanded={}, elapsed={:.4f}s)'.format(
+            __class__.__name__, self.status, self.cost, self.expanded, self.elapsed)
+
+
+class CancelToken:
+    """Cooperative cancellation, checked by the searches after every expansion.
+
+    Any event with set/clear/is_set works, e.g. a multiprocessing.Event to
+    cancel a search running in another process.
+    """
+
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def reset(self):
+        self.event.clear()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+
+def neighbors(board, index, diagonally=True):
+    # yields (neighbor index, move cost) for every free neighbor
+    size = board.size
+    cells = board.cells
+    x, y = divmod(index, size)
+    for dx in (-1, 0, 1):
+        nx = x + dx
+        if not 0 <= nx < size:
+            continue
+        for dy in (-1, 0, 1):
+            if dx == 0 and dy == 0:
+                continue
+            diagonal = dx != 0 and dy != 0
+            if diagonal and not diagonally:
+                continue
+            ny = y + dy
+            if 0 <= ny < size:
+                j = nx * size + ny
+                if cells[j] != BLOCK:
+                    yield j, 14 if diagonal else 10
+
+
+class Graph:
+    """Adjacency of a board's cells in CSR form, for one diagonal setting.
+
+    The neighbors of cell i are targets[offsets[i]:offsets[i + 1]], with the
+    move costs (10 or 14) at the same positions in costs, in the order of
+    `neighbors`. Rows around cells that changed after the build are kept in
+    `patched` until there are enough of them to rebuild the arrays.
+    """
+
+    def __init__(self, board, diagonally=True):
+        self.board = board
+        self.size = board.size
+        self.diagonally = diagonally
+        self.version = 0  # incremented on every change of the walls
+        self.sight = None  # LineOfSight, created by the first any-angle search
+        self._build()
+
+    def _build(self):
+        size = self.size
+        n = size * size
+        free = np.frombuffer(self.board.cells, dtype=np.uint8).reshape(size, size) != BLOCK
+        moves = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                 if (dx or dy) and (self.diagonally or not (dx and dy))]
+
+        # valid[i, k]: the k-th move from cell i stays on the board and ends on a free cell
+        valid = np.zeros((n, len(moves)), dtype=bool)
+        for k, (dx, dy) in enumerate(moves):
+            ok = np.zeros((size, size), dtype=bool)
+            ok[max(0, -dx):size - max(0, dx), max(0, -dy):size - max(0, dy)] = \
+                free[max(0, dx):size + min(0, dx), max(0, dy):size + min(0, dy)]
+            valid[:, k] = ok.ravel()
+        steps = np.array([dx * size + dy for dx, dy in moves], dtype=np.int32)
+        costs = np.array([14 if dx and dy else 10 for dx, dy in moves], dtype=np.uint8)
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=offsets[1:])
+
+        self.offsets = array('i', offsets.tobytes())
+        self.targets = array('i', (np.arange(n, dtype=np.int32)[:, None] + steps)[valid].tobytes())
+        self.costs = array('B', np.broadcast_to(costs, valid.shape)[valid].tobytes())
+        self.walls = ~free.ravel()
+        self.patched = {}
+        self.version += 1
+
+    def neighbors(self, index):
+        # (neighbor, move cost) pairs, like the neighbors function
+        row = self.patched.get(index)
+        if row is not None:
+            return row
+        a = self.offsets[index]
+        b = self.offsets[index + 1]
+        return zip(self.targets[a:b], self.costs[a:b])
+
+    def update_cell(self, index):
+        # a wall appearing or disappearing changes the rows of the cells around it
+        blocked = self.board.cells[index] == BLOCK
+        if self.walls[index] == blocked:
+            return
+        self.walls[index] = blocked
+        x, y = divmod(index, self.size)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx or dy) and (self.diagonally or not (dx and dy)) and \
+                        0 <= x + dx < self.size and 0 <= y + dy < self.size:
+                    u = index + dx * self.size + dy
+                    self.patched[u] = list(neighbors(self.board, u, self.diagonally))
+        self.version += 1
+
+    def sync(self):
+        walls = np.frombuffer(self.board.cells, dtype=np.uint8) == BLOCK
+        changed = np.flatnonzero(walls != self.walls)
+        # patching is only worth it for a few cells, the build is vectorized
+        if 16 * (len(changed) * 8 + len(self.patched)) > len(walls):
+            self._build()
+            return
+        for index in changed.tolist():
+            self.update_cell(index)
+
+
+def segment(size, a, b, diagonally=True):
+    # yields every cell the straight line between the centers of a and b passes,
+    # after a and up to b; a line through a corner goes diagonally, like the moves,
+    # or through the lower of the two side cells when only straight moves are allowed
+    ax, ay = divmod(a, size)
+    bx, by = divmod(b, size)
+    dx, dy = abs(bx - ax), abs(by - ay)
+    sx = size if bx > ax else -size
+    sy = 1 if by > ay else -1
+    # > 0 when the line crosses a vertical cell border before the next horizontal one
+    error = dx - dy
+    cell = a
+    while cell != b:
+        if error > 0:
+            cell += sx
+            error -= 2 * dy
+        elif error < 0:
+            cell += sy
+            error += 2 * dx
+        else:
+            if not diagonally:
+                yield min(cell + sx, cell + sy)  # the same both ways
+            cell += sx + sy
+            error += 2 * (dx - dy)
+        yield cell
+
+
+class LineOfSight:
+    """Visibility between cells of a graph's board, cached until the walls change.
+
+    The cache is cleared whenever the graph's version moves on, so results
+    are only reused for the walls they were computed for.
+    """
+
+    def __init__(self, graph, capacity=2 ** 20):
+        self.graph = graph
+        self.capacity = capacity
+        self.version = graph.version
+        self.cache = {}  # (smaller cell, bigger cell) -> visible
+
+    def visible(self, a, b) -> bool:
+        return self.visible_from(a, (b,))[0]
+
+    def visible_from(self, a, targets) -> list[bool]:
+        # the version is checked once for all the targets, and only the lines
+        # that aren't cached are walked, each until its first block
+        if self.graph.version != self.version or len(self.cache) >= self.capacity:
+            self.cache.clear()
+            self.version = self.graph.version
+        cache = self.cache
+        cells = self.graph.board.cells
+        size, diagonally = self.graph.size, self.graph.diagonally
+        result = []
+        for b in targets:
+            key = (a, b) if a < b else (b, a)
+            visible = cache.get(key)
+            if visible is None:
+                visible = cache[key] = all(cells[c] != BLOCK for c in segment(size, a, b, diagonally))
+            result.append(visible)
+        return result
+
+
+def octile(board, a, b) -> int:
+    ax, ay = divmod(a, board.size)
+    bx, by = divmod(b, board.size)
+    dx, dy = abs(ax - bx), abs(ay - by)
+    return 10 * max(dx, dy) + 4 * min(dx, dy)
+
+
+def manhattan(board, a, b) -> int:
+    ax, ay = divmod(a, board.size)
+    bx, by = divmod(b, board.size)
+    return 10 * (abs(ax - bx) + abs(ay - by))
+
+
+def _mark(marks, index, value):
+    if marks is not None:
+        marks[index] = value
+
+
+def _trace(parent, end) -> list[int]:
+    path = [end]
+    while parent[path[-1]] != -1:
+        path.append(parent[path[-1]])
+    path.reverse()
+    return path
+
+
+def _interrupted(step, token, deadline):
+    # the status that ends a search early, or None to go on;
+    # `deadline` is a time.monotonic() value
+    if step is not None and step():
+        return 'cancelled'
+    if token is not None and token.cancelled:
+        return 'cancelled'
+    if deadline is not None and time.monotonic() >= deadline:
+        return 'timeout'
+    return None
+
+
+def _heuristic(board, diagonally, landmarks):
+    if landmarks is not None and landmarks.matches(board, diagonally):
+        return landmarks.heuristic
+    return octile if diagonally else manhattan
+
+
+def _finish(path, cost, expanded, started, status=None, suboptimality=None, peak_nodes=None):
+    if status is None:
+        status = 'found' if path else 'no path'
+    return SearchResult(path, cost, expanded, time.perf_counter() - started, status,
+                        suboptimality, peak_nodes)
+
+
+def bfs(board, start, end, diagonally=True, marks=None, step=None, token=None, deadline=None):
+    # `marks` is any writable byte sequence (e.g. shared memory), `step` is called
+    # after every expansion and stops the search when it returns True, just like
+    # a cancelled `token` or a passed `deadline`
+    started = time.perf_counter()
+    graph = board.graph(diagonally)
+    parent = array('i', [-1]) * len(board.cells)
+    distance = {start: 0}
+    queue = deque([start])
+    expanded = 0
+
+    while queue:
+        u = queue.popleft()
+        expanded += 1
+        for v, _ in graph.neighbors(u):
+            if v in distance:
+                continue
+            distance[v] = distance[u] + 1
+            parent[v] = u
+            if v == end:
+                return _finish(_trace(parent, end), distance[end], expanded, started,
+                               peak_nodes=len(distance))
+            _mark(marks, v, VISITED)
+            queue.append(v)
+        if status := _interrupted(step, token, deadline):
+            return _finish([], 0, expanded, started, status, peak_nodes=len(distance))
+
+    return _finish([], 0, expanded, started, peak_nodes=len(distance))
+
+
+def _best_first(board, start, end, g_weight, h_weight, diagonally=True, marks=None, step=None,
+                token=None, deadline=None, landmarks=None):
+    # expands nodes by g_weight * g + h_weight * h; nodes are reopened when a
+    # cheaper way to them is found, which keeps the suboptimality bound provable
+    started = time.perf_counter()
+    heuristic = _heuristic(board, diagonally, landmarks)
+    graph = board.graph(diagonally)
+    parent = array('i', [-1]) * len(board.cells)
+    g_cost = {start: 0}
+    heap = [(h_weight * heuristic(board, start, end), 0, start)]
+    expanded = 0
+
+    while heap:
+        _, g, u = heapq.heappop(heap)
+        if g != g_cost[u]:
+            continue  # outdated entry
+        if u == end:
+            # some node of an optimal path is still open with its optimal g,
+            # so the smallest unweighted f on the heap bounds the optimal cost
+            lower_bound = g
+            for _, open_g, v in heap:
+                if open_g == g_cost[v]:
+                    lower_bound = min(lower_bound, open_g + heuristic(board, v, end))
+            return _finish(_trace(parent, end), g, expanded, started,
+                           suboptimality=g / lower_bound if lower_bound else 1.0,
+                           peak_nodes=len(g_cost) + len(heap))
+        expanded += 1
+        if u != start:
+            _mark(marks, u, VISITED)
+        for v, cost in graph.neighbors(u):
+            new_g = g + cost
+            if new_g < g_cost.get(v, new_g + 1):
+                g_cost[v] = new_g
+                parent[v] = u
+                heapq.heappush(heap, (g_weight * new_g + h_weight * heuristic(board, v, end), new_g, v))
+                if v != end:
+                    _mark(marks, v, VISITED_ALTERNATIVE)
+        if status := _interrupted(step, token, deadline):
+            return _finish([], 0, expanded, started, status, peak_nodes=len(g_cost) + len(heap))
+
+    return _finish([], 0, expanded, started, peak_nodes=len(g_cost))
+
+
+def a_star(board, start, end, **options):
+    return _best_first(board, start, end, 1, 1, **options)
+
+
+def weighted_a_star(board, start, end, weight=1.5, **options):
+    # weight = 1 + epsilon, the path costs at most weight * optimal cost
+    result = _best_first(board, start, end, 1, weight, **options)
+    if result.found:
+        result.suboptimality = min(result.suboptimality, weight)
+    return result
+
+
+def greedy(board, start, end, **options):
+    # greedy best-first search, only the heuristic decides
+    return _best_first(board, start, end, 0, 1, **options)
+
+
+def anytime_a_star(board, start, end, diagonally=True, marks=None, step=None, token=None,
+                   deadline=None, landmarks=None, weight=3.0, weight_step=0.5, on_solution=None):
+    """ARA*: a fast weighted A* path first, then better ones until the deadline.
+
+    Every search iteration lowers the weight by `weight_step` and reuses the
+    previous one's work, only the nodes whose cost improved are expanded again.
+    `on_solution` gets the SearchResult of every improved path; the best one is
+    returned, as 'found' even when the deadline ended the improvements.
+    """
+    started = time.perf_counter()
+    heuristic = _heuristic(board, diagonally, landmarks)
+    graph = board.graph(diagonally)
+    parent = array('i', [-1]) * len(board.cells)
+    g_cost = {start: 0}
+    h_cost = {}
+    closed = set()
+    incons = set()  # closed nodes that got cheaper during the current iteration
+    heap = []
+    expanded = 0
+    peak = 0
+    best = None
+
+    def h(index):
+        if index not in h_cost:
+            h_cost[index] = heuristic(board, index, end)
+        return h_cost[index]
+
+    def lower_bound():
+        # smallest unweighted f of the open and inconsistent nodes
+        bound = g_cost.get(end, UNREACHABLE)
+        for _, g, u in heap:
+            if g == g_cost[u] and u not in closed:
+                bound = min(bound, g + h(u))
+        for u in incons:
+            bound = min(bound, g_cost[u] + h(u))
+        return bound
+
+    heapq.heappush(heap, (weight * h(start), 0, start))
+    while True:
+        # improve the path with the current weight
+        while heap and heap[0][0] < g_cost.get(end, UNREACHABLE):
+            _, g, u = heapq.heappop(heap)
+            if g != g_cost[u] or u in closed:
+                continue
+            closed.add(u)
+            expanded += 1
+            if u != start and u != end:
+                _mark(marks, u, VISITED)
+            for v, cost in graph.neighbors(u):
+                new_g = g + cost
+                if new_g < g_cost.get(v, new_g + 1):
+                    g_cost[v] = new_g
+                    parent[v] = u
+                    if v in closed:
+                        incons.add(v)
+                    else:
+                        heapq.heappush(heap, (new_g + weight * h(v), new_g, v))
+                        if v != end:
+                            _mark(marks, v, VISITED_ALTERNATIVE)
+            peak = max(peak, len(g_cost) + len(heap))
+            if status := _interrupted(step, token, deadline):
+                if best is None:
+                    return _finish([], 0, expanded, started, status, peak_nodes=peak)
+                best.expanded = expanded
+                best.elapsed = time.perf_counter() - started
+                best.peak_nodes = peak
+                return best
+
+        if end not in g_cost:
+            return _finish([], 0, expanded, started, peak_nodes=peak)
+        if best is None or g_cost[end] < best.cost or weight == 1:
+            bound = lower_bound()
+            best = _finish(_trace(parent, end), g_cost[end], expanded, started,
+                           suboptimality=min(weight, g_cost[end] / bound if bound else 1.0))
+            if on_solution is not None:
+                on_solution(best)
+        if weight == 1 or best.suboptimality == 1:
+            best.expanded = expanded
+            best.elapsed = time.perf_counter() - started
+            best.peak_nodes = peak
+            return best
+
+        # next iteration: lower the weight, reopen the inconsistent nodes
+        weight = max(1, weight - weight_step)
+        entries = [(g_cost[u], u) for _, g, u in heap if g == g_cost[u] and u not in closed]
+        entries += [(g_cost[u], u) for u in incons]
+        heap = [(g + weight * h(u), g, u) for g, u in set(entries)]
+        heapq.heapify(heap)
+        closed.clear()
+        incons.clear()
+
+
+def ida_star(board, start, end, diagonally=True, marks=None, step=None, token=None,
+             deadline=None, landmarks=None, max_nodes=2 ** 16, growth=1.25):
+    """Iterative deepening A*, memory grows with the path length only.
+
+    Depth-first searches with a rising f threshold. Within one iteration a
+    transposition table of at most `max_nodes` entries prunes nodes reached
+    again without a cheaper g, which keeps grids from blowing up while the
+    memory stays bounded. With costs of 10 and 14 nearly every pruned node
+    has its own f, so the threshold grows by at least `growth` times per
+    iteration, which bounds their number. The iteration that reaches the end
+    keeps going with the best cost so far as its threshold, so overshooting
+    the optimal cost doesn't cost optimality.
+    """
+    started = time.perf_counter()
+    heuristic = _heuristic(board, diagonally, landmarks)
+    graph = board.graph(diagonally)
+    threshold = heuristic(board, start, end)
+    expanded = 0
+    peak = 0
+
+    while True:
+        best_g = {start: 0}
+        next_threshold = UNREACHABLE
+        cut = set()  # nodes over the threshold, bounded like the table
+        on_path = {start}
+        stack = [(start, 0, iter(graph.neighbors(start)))]
+        expanded += 1
+        path = []
+        cost = 0
+
+        while stack:
+            u, g, children = stack[-1]
+            for v, move_cost in children:
+                if v in on_path:
+                    continue
+                new_g = g + move_cost
+                if best_g.get(v, UNREACHABLE) <= new_g:
+                    continue
+                f = new_g + heuristic(board, v, end)
+                if f > threshold:
+                    next_threshold = min(next_threshold, f)
+                    if len(cut) < max_nodes:
+                        cut.add(v)
+                    else:
+                        cut.add(None)
+                    continue
+                if v == end:
+                    # from here on only cheaper paths are searched
+                    path = [node for node, _, _ in stack] + [end]
+                    cost = new_g
+                    threshold = new_g - 1
+                    continue
+                if len(best_g) < max_nodes or v in best_g:
+                    best_g[v] = new_g
+                on_path.add(v)
+                stack.append((v, new_g, iter(graph.neighbors(v))))
+                expanded += 1
+                _mark(marks, v, VISITED)
+                if status := _interrupted(step, token, deadline):
+                    return _finish([], 0, expanded, started, status,
+                                   peak_nodes=max(peak, len(stack) + len(best_g) + len(cut)))
+                break
+            else:
+                stack.pop()
+                on_path.discard(u)
+            peak = max(peak, len(stack) + len(best_g) + len(cut))
+
+        if path:
+            return _finish(path, cost, expanded, started, peak_nodes=peak)
+        # the end is never in the table, so when every cut node was expanded
+        # anyway, the whole reachable area was searched
+        if cut <= best_g.keys():
+            return _finish([], 0, expanded, started, peak_nodes=peak)
+        threshold = max(next_threshold, math.ceil(threshold * growth))
+
+
+def fringe_search(board, start, end, diagonally=True, marks=None, step=None, token=None,
+                  deadline=None, landmarks=None):
+    """Fringe search: IDA*'s thresholds without re-expanding from the start.
+
+    The fringe is a doubly linked list kept in two dicts, and g and the
+    parents are cached in dicts as well, so the memory grows with the
+    explored area only; `peak_nodes` counts the entries of all of them.
+    """
+    started = time.perf_counter()
+    heuristic = _heuristic(board, diagonally, landmarks)
+    graph = board.graph(diagonally)
+    head = -1  # sentinel of the linked list
+    next_node = {head: head}
+    prev_node = {head: head}
+    g_cost = {start: 0}
+    parent = {start: -1}
+
+    def insert_after(node, after):
+        next_node[node] = next_node[after]
+        prev_node[node] = after
+        prev_node[next_node[after]] = node
+        next_node[after] = node
+
+    def remove(node):
+        next_node[prev_node[node]] = next_node[node]
+        prev_node[next_node[node]] = prev_node[node]
+        del next_node[node], prev_node[node]
+
+    insert_after(start, head)
+    peak = 0
+    threshold = heuristic(board, start, end)
+    expanded = 0
+
+    while next_node[head] != head:
+        next_threshold = UNREACHABLE
+        node = next_node[head]
+        while node != head:
+            g = g_cost[node]
+            f = g + heuristic(board, node, end)
+            if f > threshold:
+                next_threshold = min(next_threshold, f)
+                node = next_node[node]
+                continue
+            if node == end:
+                return _finish(_trace(parent, end), g, expanded, started, peak_nodes=peak)
+
+            # children are put right after the node, so they are visited in this pass
+            expanded += 1
+            if node != start:
+                _mark(marks, node, VISITED)
+            for v, cost in graph.neighbors(node):
+                if g + cost >= g_cost.get(v, UNREACHABLE):
+                    continue
+                if v in next_node:
+                    remove(v)
+                g_cost[v] = g + cost
+                parent[v] = node
+                insert_after(v, node)
+                if v != end:
+                    _mark(marks, v, VISITED_ALTERNATIVE)
+            following = next_node[node]
+            remove(node)
+            node = following
+            peak = max(peak, 2 * len(g_cost) + 2 * len(next_node))
+            if status := _interrupted(step, token, deadline):
+                return _finish([], 0, expanded, started, status, peak_nodes=peak)
+
+        if next_threshold == UNREACHABLE:
+            break
+        threshold = next_threshold
+
+    return _finish([], 0, expanded, started, peak_nodes=peak)
+
+
+def theta_star(board, start, end, diagonally=True, marks=None, step=None, token=None,
+               deadline=None, landmarks=None):
+    """Any-angle A*: the parent of a node may be any cell it can see.
+
+    A node reached from an expanded cell takes that cell's parent instead
+    when the line between them is free, so the path comes out as a few
+    straight segments and its cost is the euclidean length (in tenths of a
+    cell). `path` only holds the waypoints, see `path_cells`. Landmarks
+    measure grid distances, which aren't admissible here, so they are ignored.
+    """
+    started = time.perf_counter()
+    graph = board.graph(diagonally)
+    if graph.sight is None:
+        graph.sight = LineOfSight(graph)
+    sight = graph.sight
+    size = board.size
+
+    def distance(a, b) -> float:
+        ax, ay = divmod(a, size)
+        bx, by = divmod(b, size)
+        return 10 * math.hypot(ax - bx, ay - by)
+
+    parent = array('i', [-1]) * len(board.cells)
+    g_cost = {start: 0.0}
+    closed = set()
+    heap = [(distance(start, end), 0.0, start)]
+    expanded = 0
+
+    while heap:
+        _, g, u = heapq.heappop(heap)
+        if g != g_cost[u] or u in closed:
+            continue
+        if u == end:
+            return _finish(_trace(parent, end), round(g), expanded, started,
+                           peak_nodes=len(g_cost) + len(heap))
+        closed.add(u)
+        expanded += 1
+        if u != start:
+            _mark(marks, u, VISITED)
+
+        p = parent[u] if u != start else u
+        children = [v for v, _ in graph.neighbors(u) if v not in closed]
+        for v, visible in zip(children, sight.visible_from(p, children)):
+            if visible:
+                new_g, via = g_cost[p] + distance(p, v), p
+            else:
+                new_g, via = g + distance(u, v), u
+            if new_g < g_cost.get(v, math.inf):
+                g_cost[v] = new_g
+                parent[v] = via
+                heapq.heappush(heap, (new_g + distance(v, end), new_g, v))
+                if v != end:
+                    _mark(marks, v, VISITED_ALTERNATIVE)
+        if status := _interrupted(step, token, deadline):
+            return _finish([], 0, expanded, started, status, peak_nodes=len(g_cost) + len(heap))
+
+    return _finish([], 0, expanded, started, peak_nodes=len(g_cost))
+
+
+def path_cells(board, path, diagonally=True) -> list[int]:
+    # every cell on the way along a path of waypoints; grid paths come back unchanged
+    cells = path[:1]
+    for a, b in zip(path, path[1:]):
+        cells.extend(segment(board.size, a, b, diagonally))
+    return cells
+
+
+def measure_memory(algorithm, *args, **kwargs):
+    # runs a search under tracemalloc and stores its peak allocation in peak_bytes;
+    # tracing makes the search itself a few times slower
+    tracemalloc.start()
+    try:
+        result = algorithm(*args, **kwargs)
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+ALGORITHMS = {
+    'bfs': bfs,
+    'a_star': a_star,
+    'weighted_a_star': weighted_a_star,
+    'greedy': greedy,
+    'anytime_a_star': anytime_a_star,
+    'ida_star': ida_star,
+    'fringe_search': fringe_search,
+    'theta_star': theta_star,
+}
+
+
+UNREACHABLE = 2 ** 31 - 1
+
+
+class FlowField:
+    """Reverse Dijkstra from a single goal, shared by any number of agents.
+
+    `cost` is the integration field (distance to the goal in 10/14 units) and
+    `direction` holds the next cell towards the goal for every reachable cell.
+    Painting a single cell only repairs the part of the field it affects.
+    """
+
+    def __init__(self, board, goal, diagonally=True):
+        self.board = board
+        self.graph = board.graph(diagonally)
+        self.goal = goal
+        self.diagonally = diagonally
+        n = len(board.cells)
+        self.cost = array('i', [UNREACHABLE]) * n
+        self.direction = array('i', [-1]) * n
+        self.cost[goal] = 0
+        self._propagate([(0, goal)])
+
+    def next(self, index) -> int:
+        return self.direction[index]
+
+    def _propagate(self, heap):
+        cost = self.cost
+        direction = self.direction
+        heapq.heapify(heap)
+        while heap:
+            c, u = heapq.heappop(heap)
+            if c > cost[u]:
+                continue
+            for v, step in self.graph.neighbors(u):
+                if c + step < cost[v]:
+                    cost[v] = c + step
+                    direction[v] = u
+                    heapq.heappush(heap, (c + step, v))
+
+    def update_cell(self, index, cell):
+        was_blocked = self.board.cells[index] == BLOCK
+        self.board.set_cell(index, cell)
+        if was_blocked == (cell == BLOCK):
+            return
+
+        cost = self.cost
+        direction = self.direction
+        if cell != BLOCK and index == self.goal:
+            # blocking the goal invalidated the whole field, it grows back from scratch
+            cost[index] = 0
+            self._propagate([(0, index)])
+            return
+        if cell != BLOCK:
+            # a freed cell can only shorten distances, so continue from its best neighbor
+            for v, step in self.graph.neighbors(index):
+                if cost[v] != UNREACHABLE and cost[v] + step < cost[index]:
+                    cost[index] = cost[v] + step
+                    direction[index] = v
+            if cost[index] != UNREACHABLE:
+                self._propagate([(cost[index], index)])
+            return
+
+        # a new block invalidates every cell whose way to the goal went through it
+        invalid = [index]
+        for u in invalid:
+            cost[u] = UNREACHABLE
+            direction[u] = -1
+            for v, _ in self.graph.neighbors(u):
+                if direction[v] == u:
+                    invalid.append(v)
+        if index == self.goal:
+            return
+
+        # and those cells are repaired from their still valid neighbors
+        heap = []
+        for u in invalid[1:]:
+            for v, step in self.graph.neighbors(u):
+                if cost[v] != UNREACHABLE and cost[v] + step < cost[u]:
+                    cost[u] = cost[v] + step
+                    direction[u] = v
+            if cost[u] != UNREACHABLE:
+                heap.append((cost[u], u))
+        self._propagate(heap)
+
+
+def dijkstra(board, source, diagonally=True):
+    # cost from `source` to every cell, UNREACHABLE for walls and other components
+    graph = board.graph(diagonally)
+    cost = array('i', [UNREACHABLE]) * len(board.cells)
+    cost[source] = 0
+    heap = [(0, source)]
+    while heap:
+        c, u = heapq.heappop(heap)
+        if c > cost[u]:
+            continue
+        for v, step in graph.neighbors(u):
+            if c + step < cost[v]:
+                cost[v] = c + step
+                heapq.heappush(heap, (c + step, v))
+    return cost
+
+
+def walls_digest(board) -> str:
+    # identifies the walls of a board, targets and agents don't change distances
+    walls = bytes(board.cells).translate(bytes(1 if c == BLOCK else 0 for c in range(256)))
+    return hashlib.sha1(walls).hexdigest()
+
+
+class Landmarks:
+    """ALT heuristic: exact distances from a few landmark cells.
+
+    By the triangle inequality |d(L, a) - d(L, b)| <= d(a, b) for every
+    landmark L, so the largest of those bounds (and the octile distance)
+    is an admissible and consistent A* heuristic that also knows the walls.
+    """
+
+    def __init__(self, board, count=8, diagonally=True, landmarks=None, distances=None):
+        self.size = board.size
+        self.diagonally = diagonally
+        self.digest = walls_digest(board)
+        self.landmarks = landmarks if landmarks is not None else []
+        self.distances = distances if distances is not None else []
+        if landmarks is None:
+            self._choose(board, count)
+
+    def _choose(self, board, count):
+        # farthest point selection: every landmark is the cell farthest from the
+        # ones chosen so far, which spreads them along the edges of the board
+        free = [i for i, cell in enumerate(board.cells) if cell != BLOCK]
+        if not free:
+            return
+        closest = dijkstra(board, free[0], self.diagonally)
+        for _ in range(count):
+            landmark = max(free, key=lambda i: -1 if closest[i] == UNREACHABLE else closest[i])
+            if closest[landmark] <= 0:
+                break
+            distances = dijkstra(board, landmark, self.diagonally)
+            self.landmarks.append(landmark)
+            self.distances.append(distances)
+            if len(self.landmarks) == 1:
+                closest = array('i', distances)  # forget the starting cell
+            else:
+                for i in free:
+                    if distances[i] < closest[i]:
+                        closest[i] = distances[i]
+            closest[landmark] = 0
+
+    def matches(self, board, diagonally) -> bool:
+        return board.size == self.size and diagonally == self.diagonally and \
+            walls_digest(board) == self.digest
+
+    def heuristic(self, board, a, b) -> int:
+        best = octile(board, a, b) if self.diagonally else manhattan(board, a, b)
+        for distances in self.distances:
+            da, db = distances[a], distances[b]
+            if da != UNREACHABLE and db != UNREACHABLE and abs(da - db) > best:
+                best = abs(da - db)
+        return best
+
+    def save(self, filename):
+        with open(filename, 'wb') as landmarks_file:
+            header = {'size': self.size, 'diagonally': self.diagonally,
+                      'digest': self.digest, 'landmarks': self.landmarks}
+            landmarks_file.write(json.dumps(header).encode() + b'\n')
+            for distances in self.distances:
+                distances.tofile(landmarks_file)
+
+    @classmethod
+    def load(cls, filename, board):
+        # returns None when the file is missing or belongs to other walls
+        try:
+            with open(filename, 'rb') as landmarks_file:
+                header = json.loads(landmarks_file.readline())
+                distances = []
+                for _ in header['landmarks']:
+                    distances.append(array('i'))
+                    distances[-1].fromfile(landmarks_file, len(board.cells))
+        except (OSError, ValueError, EOFError, KeyError):
+            return None
+        if header['size'] != board.size or header['digest'] != walls_digest(board):
+            return None
+        return cls(board, diagonally=header['diagonally'],
+                   landmarks=header['landmarks'], distances=distances)
@@ -0,0 +1,254 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import engine
+
+# all generators return a (size, size) bool array of blocks, indexed [x, y]
+
+
+def noise(size, rng, density=0.3):
+    return rng.random((size, size)) < density
+
+
+def _count_walls(blocks):
+    # number of blocked cells in the 3x3 neighborhood, borders count as walls
+    padded = np.pad(blocks, 1, constant_values=True).astype(np.uint8)
+    count = np.zeros(blocks.shape, dtype=np.uint8)
+    for dx in range(3):
+        for dy in range(3):
+            if dx != 1 or dy != 1:
+                count += padded[dx:dx + blocks.shape[0], dy:dy + blocks.shape[1]]
+    return count
+
+
+def caves(size, rng, density=0.45, steps=4):
+    blocks = rng.random((size, size)) < density
+    for _ in range(steps):
+        walls = _count_walls(blocks)
+        blocks = (walls >= 5) | (blocks & (walls >= 4))
+    return blocks
+
+
+def rooms(size, rng, room_count=None):
+    blocks = np.ones((size, size), dtype=bool)
+    if room_count is None:
+        room_count = max(2, size * size // 300)
+    max_room = max(3, size // 8)
+    widths = rng.integers(2, max_room, room_count)
+    heights = rng.integers(2, max_room, room_count)
+    xs = rng.integers(0, np.maximum(1, size - widths))
+    ys = rng.integers(0, np.maximum(1, size - heights))
+    centers_x = xs + widths // 2
+    centers_y = ys + heights // 2
+    for i in range(room_count):
+        blocks[xs[i]:xs[i] + widths[i], ys[i]:ys[i] + heights[i]] = False
+        if i:
+            # L-shaped corridor to the previous room
+            x0, x1 = sorted((centers_x[i - 1], centers_x[i]))
+            y0, y1 = sorted((centers_y[i - 1], centers_y[i]))
+            blocks[x0:x1 + 1, centers_y[i - 1]] = False
+            blocks[centers_x[i], y0:y1 + 1] = False
+    return blocks
+
+
+def _maze_lattice(size):
+    # maze cells sit on odd coordinates of a (2 * cells + 1) lattice, the cells
+    # between them are walls; the lattice is padded by one cell on every side,
+    # and the padding counts as already visited, so no bounds checks are needed
+    cells = (size - 1) // 2
+    if cells < 1:
+        raise ValueError('The board is too small for a maze')
+    lattice = 2 * cells + 1
+    width = lattice + 2
+    grid = bytearray(width * width)
+    grid[:width] = grid[-width:] = b'\x01' * width
+    grid[::width] = grid[width - 1::width] = b'\x01' * width
+    return cells, width, grid
+
+
+def _carve(size, width, grid):
+    # turns the carved lattice into a block array of the full board size
+    blocks = np.ones((size, size), dtype=bool)
+    lattice = width - 2
+    carved = np.frombuffer(grid, dtype=np.uint8).reshape(width, width)
+    blocks[:lattice, :lattice] = carved[1:-1, 1:-1] == 0
+    return blocks
+
+
+def backtracker(size, rng):
+    cells, width, grid = _maze_lattice(size)
+    step = 2 * width
+    randoms = rng.random(cells * cells).tolist()
+    r = 0
+    stack = []
+    c = 2 * width + 2
+    grid[c] = 1
+
+    # the hot loop is written out by hand, it runs for every cell of the maze
+    while True:
+        options = []
+        if not grid[c + 2]:
+            options.append(c + 2)
+        if not grid[c - 2]:
+            options.append(c - 2)
+        if not grid[c + step]:
+            options.append(c + step)
+        if not grid[c - step]:
+            options.append(c - step)
+        if not options:
+            if not stack:
+                break
+            c = stack.pop()
+            continue
+        n = options[int(randoms[r] * len(options))]
+        r += 1
+        # open the cell and the wall between it and its parent
+        grid[n] = 1
+        grid[(c + n) >> 1] = 1
+        stack.append(c)
+        c = n
+    return _carve(size, width, grid)
+
+
+def prim(size, rng):
+    # Prim's algorithm over random wall weights grows the minimum spanning tree
+    # of the maze cells; Boruvka builds the same tree in a few vectorized rounds:
+    # every part of the maze opens its cheapest wall to another part at once
+    cells, _, _ = _maze_lattice(size)
+    ids = np.arange(cells * cells).reshape(cells, cells)
+    a = np.concatenate([ids[:-1].ravel(), ids[:, :-1].ravel()])
+    b = np.concatenate([ids[1:].ravel(), ids[:, 1:].ravel()])
+    weights = rng.permutation(len(a))
+    edge_of = np.argsort(weights)
+    opened = np.zeros(len(a), dtype=bool)
+    labels = np.arange(cells * cells)
+    outgoing = np.arange(len(a))
+    while True:
+        label_a = labels[a[outgoing]]
+        label_b = labels[b[outgoing]]
+        between = label_a != label_b
+        if not between.any():
+            break
+        outgoing, label_a, label_b = outgoing[between], label_a[between], label_b[between]
+        cheapest = np.full(len(labels), len(a))
+        np.minimum.at(cheapest, label_a, weights[outgoing])
+        np.minimum.at(cheapest, label_b, weights[outgoing])
+        chosen = edge_of[cheapest[cheapest < len(a)]]  # a wall may be the cheapest of both sides
+        opened[chosen] = True
+        labels = _merge(labels, a[chosen], b[chosen])
+
+    blocks = np.ones((size, size), dtype=bool)
+    blocks[1:2 * cells:2, 1:2 * cells:2] = False
+    x, y = np.divmod(a[opened], cells)
+    nx, ny = np.divmod(b[opened], cells)
+    blocks[x + nx + 1, y + ny + 1] = False  # the wall between two cells
+    return blocks
+
+
+def _merge(labels, a, b):
+    # hooks the bigger label of every pair onto the smaller one and jumps
+    # pointers, until both cells of every pair have the same label
+    while len(a):
+        label_a = labels[a]
+        label_b = labels[b]
+        differ = label_a != label_b
+        a, b, label_a, label_b = a[differ], b[differ], label_a[differ], label_b[differ]
+        np.minimum.at(labels, np.maximum(label_a, label_b), np.minimum(label_a, label_b))
+        while not np.array_equal(jumped := labels[labels], labels):
+            labels = jumped
+    return labels
+
+
+MODES = {
+    'backtracker': backtracker,
+    'prim': prim,
+    'caves': caves,
+    'noise': noise,
+    'rooms': rooms,
+}
+
+
+# mazes reach every open cell by construction, so they skip the region search
+CONNECTED = {'backtracker', 'prim'}
+
+
+def generate(mode, size, seed=None, **options):
+    rng = np.random.default_rng(seed)
+    blocks = MODES[mode](size, rng, **options)
+    return to_board(blocks, connected=mode in CONNECTED)
+
+
+def _largest_region(blocks):
+    # (xs, ys) of the biggest 4-connected area of free cells; runs of free cells
+    # along y get a label each, then the runs touching along x are merged
+    size = blocks.shape[0]
+    free = ~blocks
+    if not free.any():
+        return np.nonzero(free)
+    starts = free.copy()
+    starts[:, 1:] &= blocks[:, :-1]
+    run = np.cumsum(starts.ravel()).reshape(size, size) - 1
+    touching = free[:-1] & free[1:]
+    labels = _merge(np.arange(run[-1, -1] + 1), run[:-1][touching], run[1:][touching])
+    cell_labels = labels[run[free]]
+    xs, ys = np.nonzero(free)
+    region = cell_labels == np.bincount(cell_labels).argmax()
+    return xs[region], ys[region]
+
+
+def to_board(blocks, connected=False):
+    # turns a block array into a board with targets near two opposite corners
+    # of its largest area, so there is always a path between them
+    size = blocks.shape[0]
+    cells = blocks.astype(np.uint8) * engine.BLOCK
+    free_x, free_y = np.nonzero(~blocks) if connected else _largest_region(blocks)
+    if len(free_x) >= 2:
+        corner = free_x + free_y
+        start = np.argmin(corner)
+        end = np.argmax(corner)
+        cells[free_x[start], free_y[start]] = engine.TARGET
+        cells[free_x[end], free_y[end]] = engine.TARGET
+    return engine.Board(size, bytearray(cells.tobytes()))
+
+
+def benchmark(size=1000, seeds=3, limit=1.0) -> bool:
+    # times every mode, False when one of them took `limit` seconds or more
+    fast = True
+    for mode in MODES:
+        times = []
+        for seed in range(seeds):
+            started = time.perf_counter()
+            generate(mode, size, seed)
+            times.append(time.perf_counter() - started)
+        fast &= max(times) < limit
+        print(f'{mode}: {min(times):.3f}s - {max(times):.3f}s for {size}x{size}')
+    return fast
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a board and save it to the boards folder')
+    parser.add_argument('mode', nargs='?', choices=MODES)
+    parser.add_argument('size', nargs='?', type=int)
+    parser.add_argument('name', nargs='?', help='board name, saved as <boards folder>/<name>.pth')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--folder', default='boards')
+    parser.add_argument('--bench', action='store_true',
+                        help='time every mode (1000x1000 unless a size is given), fail if one takes a second')
+    args = parser.parse_args()
+
+    if args.bench:
+        sys.exit(0 if benchmark(args.size or 1000) else 1)
+    if args.name is None:
+        parser.error('mode, size and name are required')
+
+    started = time.perf_counter()
+    board = generate(args.mode, args.size, args.seed)
+    print(f'Generated a {args.size}x{args.size} {args.mode} board in {time.perf_counter() - started:.3f}s')
+    board.save(f'{args.folder}/{args.name}.pth')
+
+
+if __name__ == '__main__':
+    main()
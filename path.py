@@ -1,9 +1,15 @@
-import pygame
 import time
+STARTUP_TIME = time.perf_counter()
+
+import pygame
 import threading
 import ui_elements as UI
+import engine
+import generator
+import worker
 import json
-import re
+import random
+from array import array
 
 pygame.init()
 
@@ -22,6 +28,7 @@ class Tile(UI.Label):
 
         self._tile_type = ''
         self.tile_type = kwargs.get('tile_type', '')
+        self.on_paint = kwargs.get('on_paint')  # called after the user paints the tile
 
     @property
     def tile_type(self) -> str:
@@ -36,6 +43,17 @@ class Tile(UI.Label):
         else:
             self.color = GLOBALS[f'TILE_COLOR_TYPE_{value}']
 
+    def reposition(self, x, y, size, font, blank_text):
+        # reuses the tile for another grid size, `blank_text` is a rendered empty string
+        self.x = x
+        self.y = y
+        self.width = self.height = self.size = size
+        self.font = font
+        self._text = ''
+        self.text_obj = blank_text
+        self.text_pos = [x, y]
+        self.tile_type = ''
+
     def draw(self, surface):
         pygame.draw.rect(
             surface, GLOBALS['TILE_BORDER_COLOR'], (self.x, self.y, self.size, self.size))
@@ -57,16 +75,28 @@ class Tile(UI.Label):
         )
         return rounded_point == (self.x, self.y)
 
+    def mark(self, mark_type) -> None:
+        # search marks only cover empty tiles, painted agents keep their type
+        if self.tile_type in engine.MARK_TYPES:
+            self.tile_type = mark_type
+
+    def paint(self, tile_type) -> None:
+        if tile_type == self.tile_type:
+            return
+        self.tile_type = tile_type
+        if self.on_paint:
+            self.on_paint(self)
+
     def update(self, keys, mouse, dt, events) -> None:
         if mouse.get_pressed()[0]:
             if self.check_collision(mouse.get_pos()):
-                self.tile_type = 'BLOCK'
+                self.paint('AGENT' if keys[pygame.K_a] else 'BLOCK')
         elif mouse.get_pressed()[1]:
             if self.check_collision(mouse.get_pos()):
-                self.tile_type = ''
+                self.paint('')
         elif mouse.get_pressed()[2]:
             if self.check_collision(mouse.get_pos()):
-                self.tile_type = 'TARGET'
+                self.paint('TARGET')
 
     def __repr__(self) -> str:
         return '{}({}, {}, {})'.format(
@@ -77,31 +107,134 @@ class Tile(UI.Label):
         )
 
 
+class TileMarks:
+    # lets engine searches running in the search thread mark the tiles through the event ring
+    def __init__(self, events):
+        self.events = events
+
+    def __setitem__(self, index, mark):
+        self.events.push(index, engine.MARK_TYPES[mark])
+
+
+class EventRing:
+    """Single producer, single consumer ring of (cell, tile type, text) updates.
+
+    The search thread pushes and the main loop drains every frame, so tiles
+    are only changed by the thread that draws them. The producer never waits:
+    while the ring is full its updates are merged per cell in `overflow` and
+    moved to the ring once there is room. None keeps the tile type or text.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.cells = array('i', [0]) * capacity
+        self.states = [None] * capacity
+        self.labels = [None] * capacity
+        self.head = 0  # only written by the producer
+        self.tail = 0  # only written by the consumer
+        self.overflow = {}  # cell -> (state, label), only used by the producer
+
+    def push(self, cell, state=None, label=None):
+        if self.overflow and not self._flush():
+            self._merge(self.overflow, cell, state, label)
+        elif self.head - self.tail < self.capacity:
+            slot = self.head % self.capacity
+            self.cells[slot] = cell
+            self.states[slot] = state
+            self.labels[slot] = label
+            self.head += 1
+        else:
+            self._merge(self.overflow, cell, state, label)
+
+    def _flush(self) -> bool:
+        # moves as much of the overflow to the ring as fits, True when it is empty
+        room = self.capacity - (self.head - self.tail)
+        for cell in list(self.overflow)[:room]:
+            slot = self.head % self.capacity
+            self.cells[slot] = cell
+            self.states[slot], self.labels[slot] = self.overflow.pop(cell)
+            self.head += 1
+        return not self.overflow
+
+    def finish(self, token):
+        # called by the producer when it is done, waits for room unless cancelled
+        while not self._flush():
+            if token.cancelled:
+                self.overflow.clear()
+                return
+            time.sleep(0.001)
+
+    def drain(self) -> dict:
+        # returns {cell: (state, label)} with the latest update of every cell
+        head = self.head
+        updates = {}
+        for i in range(self.tail, head):
+            slot = i % self.capacity
+            self._merge(updates, self.cells[slot], self.states[slot], self.labels[slot])
+        self.tail = head
+        return updates
+
+    def discard(self):
+        self.tail = self.head
+
+    @staticmethod
+    def _merge(updates, cell, state, label):
+        if cell in updates:
+            old_state, old_label = updates[cell]
+            state = old_state if state is None else state
+            label = old_label if label is None else label
+        updates[cell] = (state, label)
+
+
 class Game:
     def __init__(self, size):
         self._size = size
         self.tile_size = GLOBALS['HEIGHT'] // size
         self.tiles = []
+        self.events = EventRing(GLOBALS['EVENT_QUEUE_SIZE'])  # tile updates from the search thread
+        self.tile_pool = []  # every Tile created so far, reused by generate()
+        self.pending_size = None  # chosen with the grid size button, applied by update()
+        self.resize_time = 0.0
+        self.flow = None  # FlowField of the flow_field method
+        self.board = None  # engine.Board of the tiles, kept between searches for its graphs
+        self.landmarks = None  # engine.Landmarks of the current board, computed on demand
+        self.options = {}  # engine arguments of the running search
+        self.agents = []  # [from cell, to cell] of every agent following the flow
+        self.agent_time = 0.0
+        self.t = threading.Thread()
+        self.worker = None  # SearchWorker, created for the first search in a process
+        self.cancel_token = engine.CancelToken()  # of the search thread
         self.size = size
-        self.path_algs = [self.bfs, self.a_star]
+        self.path_algs = [self.bfs, self.a_star, self.weighted_a_star, self.greedy,
+                          self.anytime_a_star, self.ida_star, self.fringe_search, self.theta_star,
+                          self.flow_field]
         self.path_alg_indx = 0
-        self.t = threading.Thread()
 
         self.wait_for_keypress = GLOBALS['WAIT_FOR_KEYPRESS']
         self.skip_waiting = False
         self.ui_elements = []
-        self.board_button_manager = UI.BoardButtonManager(self, GLOBALS['BOARDS_FOLDER'])
+        self.board_button_manager = UI.BoardButtonManager(
+            self,
+            GLOBALS['BOARDS_FOLDER'],
+            GLOBALS['WIDTH'],
+            GLOBALS['HEIGHT'] - 100,
+            [GLOBALS[f'TILE_COLOR_TYPE_{cell_type or "DEFAULT"}'] for cell_type in engine.CELL_TYPES],
+            GLOBALS['TILE_BORDER_COLOR'],
+            threads=GLOBALS['GALLERY_THREADS']
+        )
         self.boards_buttons = []
+        self.race_panes = []  # RacePane of every method in the running race
+        self.race_buttons = []
         self.show_screen_index = 0
         self.screen_elements = [
             [self.ui_elements, self.tiles],  # main screen
             # screen for choosing boards
             [self.board_button_manager, self.boards_buttons],
+            # race of RACE_ALGORITHMS on the current board
+            [self.race_panes, self.race_buttons],
         ]
 
         # UI
-        self.font = pygame.font.SysFont(
-            '', round(48 * GLOBALS['HEIGHT'] / 1000 * 20 / self.size))
         UI_FONT_COLOR = GLOBALS['UI_FONT_COLOR']
 
         def start_search(button, pressed):
@@ -134,6 +267,42 @@ class Game:
             anchor_y='top'
         ))
 
+        def change_search_mode(button, pressed):
+            if self.search_running():
+                return
+            GLOBALS['SEARCH_IN_PROCESS'] = not GLOBALS['SEARCH_IN_PROCESS']
+            button.text = f'Search in: {"process" if GLOBALS["SEARCH_IN_PROCESS"] else "thread"}'
+        self.ui_elements.append(UI.Button(
+            UI_START_X + UI_WIDTH // 2 - 5,
+            130,
+            190,
+            50,
+            f'Search in: {"process" if GLOBALS["SEARCH_IN_PROCESS"] else "thread"}',
+            action=change_search_mode,
+            font_color=(UI_FONT_COLOR),
+            colors=GLOBALS['UI_BUTTON_COLORS'],
+            anchor_x='right',
+            anchor_y='top'
+        ))
+
+        def start_race(button, pressed):
+            if self.search_running():
+                return
+            if self.start_race():
+                self.show_screen_index = 2
+        self.ui_elements.append(UI.Button(
+            UI_START_X + UI_WIDTH // 2 + 5,
+            130,
+            190,
+            50,
+            f'Race',
+            action=start_race,
+            font_color=(UI_FONT_COLOR),
+            colors=GLOBALS['UI_BUTTON_COLORS'],
+            anchor_x='left',
+            anchor_y='top'
+        ))
+
         self.board_name_input = UI.TextInput(
             UI_START_X + UI_WIDTH // 2,
             GLOBALS['HEIGHT'] - 550,
@@ -178,11 +347,19 @@ class Game:
         ))
 
         def change_path_finding_method(button, pressed):
-            if self.t.is_alive():
+            if self.search_running():
+                return
+            if pressed[2]:
+                # RMB changes the epsilon of weighted A* and the time budget of anytime A*
+                if self.path_algs[self.path_alg_indx] == self.weighted_a_star:
+                    GLOBALS['EPSILON'] = round(GLOBALS['EPSILON'] + 0.25, 2) % 5
+                if self.path_algs[self.path_alg_indx] == self.anytime_a_star:
+                    GLOBALS['SEARCH_TIME_BUDGET'] = GLOBALS['SEARCH_TIME_BUDGET'] % 10 + 1
+                button.text = self.method_text()
                 return
             self.path_alg_indx += pressed[0] - pressed[1]
             self.path_alg_indx %= len(self.path_algs)
-            button.text = f'Method: {self.path_algs[self.path_alg_indx].__name__}'
+            button.text = self.method_text()
             if self.path_algs[self.path_alg_indx] == self.a_star:
                 GLOBALS['DIAGONALLY'] = True
                 print('Diagonal setting is ignored in order for A* to work properly')
@@ -191,7 +368,7 @@ class Game:
             GLOBALS['HEIGHT'] - 370,
             300,
             50,
-            f'Method: {self.path_algs[self.path_alg_indx].__name__}',
+            self.method_text(),
             action=change_path_finding_method,
             font_color=(UI_FONT_COLOR),
             colors=GLOBALS['UI_METHOD_BUTTON_COLORS'],
@@ -203,6 +380,8 @@ class Game:
             self.skip_waiting = GLOBALS['WAIT_FOR_KEYPRESS']
             GLOBALS['WAIT_FOR_KEYPRESS'] = not GLOBALS['WAIT_FOR_KEYPRESS']
             self.wait_for_keypress = GLOBALS['WAIT_FOR_KEYPRESS']
+            if self.worker:
+                self.worker.set_wait_for_step(GLOBALS['WAIT_FOR_KEYPRESS'])
             button.text = f'Wait for press(N): {GLOBALS["WAIT_FOR_KEYPRESS"]}'
         self.ui_elements.append(UI.Button(
             UI_START_X + UI_WIDTH // 2,
@@ -239,12 +418,15 @@ class Game:
         ))
 
         def change_grid_size(button, pressed):
-            if self.t.is_alive():
+            # the grid is rebuilt once the size stops changing, see apply_pending_size
+            if self.search_running():
                 return
-            self.size %= 100
-            self.size += 1 * (pressed[0] - pressed[2])
-            self.size = max(2, self.size)
-            button.text = f'Grid size: {self.size}x{self.size}'
+            size = self.pending_size or self.size
+            size %= 100
+            size += 1 * (pressed[0] - pressed[2])
+            self.pending_size = max(2, size)
+            self.resize_time = 0.0
+            button.text = f'Grid size: {self.pending_size}x{self.pending_size}'
         self.ui_elements.append(UI.Button(
             UI_START_X + UI_WIDTH // 2,
             GLOBALS['HEIGHT'] - 190,
@@ -286,7 +468,7 @@ class Game:
         ))
 
         def set_diagonally_btn_txt(button, pressed):
-            if self.t.is_alive():
+            if self.search_running():
                 return
             GLOBALS['DIAGONALLY'] = not GLOBALS['DIAGONALLY']
             button.text = f'Diagonal connections: {GLOBALS["DIAGONALLY"]}'
@@ -306,15 +488,46 @@ class Game:
         def clear_board(button, pressed):
             self.generate()
         self.ui_elements.append(UI.Button(
-            UI_START_X + UI_WIDTH // 2,
+            UI_START_X + UI_WIDTH // 2 - 5,
             GLOBALS['HEIGHT'] - 10,
-            200,
+            190,
             50,
             f'Clear the board',
             action=clear_board,
             font_color=(UI_FONT_COLOR),
             colors=GLOBALS['UI_BUTTON_COLORS'],
-            anchor_x='center',
+            anchor_x='right',
+            anchor_y='bottom'
+        ))
+
+        generator_modes = list(generator.MODES)
+        self.generator_mode = 0
+
+        def generate_board(button, pressed):
+            if self.search_running():
+                return
+            if pressed[0]:
+                seed = random.randrange(2 ** 32)
+                mode = generator_modes[self.generator_mode]
+                print(f'Generating a {mode} board with seed {seed}')
+                try:
+                    self.apply_board(generator.generate(mode, self.size, seed))
+                except ValueError as e:
+                    print(f'{e}, make the grid bigger')
+            else:
+                self.generator_mode += pressed[2] - pressed[1]
+                self.generator_mode %= len(generator_modes)
+                button.text = f'Gen: {generator_modes[self.generator_mode]}'
+        self.ui_elements.append(UI.Button(
+            UI_START_X + UI_WIDTH // 2 + 5,
+            GLOBALS['HEIGHT'] - 10,
+            190,
+            50,
+            f'Gen: {generator_modes[self.generator_mode]}',
+            action=generate_board,
+            font_color=(UI_FONT_COLOR),
+            colors=GLOBALS['UI_BUTTON_COLORS'],
+            anchor_x='left',
             anchor_y='bottom'
         ))
 
@@ -348,12 +561,38 @@ class Game:
             anchor_y='bottom'
         ))
 
-        # finally, load the default board to the screen
+        # Race screen
+        def leave_race(button, pressed):
+            self.stop_race()
+            self.show_screen_index = 0
+        self.race_buttons.append(UI.Button(
+            GLOBALS['WIDTH']//2 - 10,
+            GLOBALS['HEIGHT']-25,
+            200,
+            50,
+            'Back',
+            action=leave_race,
+            anchor_x='right',
+            anchor_y='bottom'
+        ))
+
+        def restart_race(button, pressed):
+            self.start_race()
+        self.race_buttons.append(UI.Button(
+            GLOBALS['WIDTH']//2 + 10,
+            GLOBALS['HEIGHT']-25,
+            200,
+            50,
+            'Race again',
+            action=restart_race,
+            anchor_x='left',
+            anchor_y='bottom'
+        ))
+
+        # finally, the default board is loaded after the first frame is shown
+        self.pending_board = None
         if GLOBALS['LOAD_DEAFULT_BOARD_ON_STARTUP']:
-            try:
-                self.load_board('default_board')
-            except ValueError as e:
-                print("There is no default board!")
+            self.pending_board = 'default_board'
 
     def draw(self, surface):
         def perform_draw(item):
@@ -366,6 +605,9 @@ class Game:
         for item in self.screen_elements[self.show_screen_index]:
             perform_draw(item)
 
+        if self.show_screen_index == 0 and self.agents:
+            self.draw_agents(surface)
+
     def update(self, keys, mouse, dt, events):
         def perform_update(item):
             if type(item) == list:
@@ -377,6 +619,38 @@ class Game:
         for item in self.screen_elements[self.show_screen_index]:
             perform_update(item)
 
+        self.drain_events()
+        if self.worker and self.worker.busy:
+            self.sync_worker()
+
+        if self.agents:
+            self.move_agents(dt)
+
+        if self.pending_size:
+            self.apply_pending_size(mouse, dt)
+
+    def drain_events(self):
+        for index, (state, label) in self.events.drain().items():
+            tile = self.tiles[index // self.size][index % self.size]
+            if state is not None:
+                tile.mark(state)
+            if isinstance(label, tuple):  # g, h and f of the tile-based A*
+                tile.font = self.mini_font
+                tile.text = ' | '.join(map(str, label))
+            elif label is not None:
+                tile.text = label
+
+    def apply_pending_size(self, mouse, dt):
+        # holding the grid size button keeps postponing the resize
+        if any(mouse.get_pressed()) or self.search_running():
+            self.resize_time = 0.0
+            return
+        self.resize_time += dt / 1000
+        if self.resize_time >= GLOBALS['RESIZE_DELAY']:
+            if self.pending_size != self.size:
+                self.size = self.pending_size
+            self.pending_size = None
+
     @property
     def size(self) -> int:
         return self._size
@@ -384,62 +658,168 @@ class Game:
     @size.setter
     def size(self, value: int) -> None:
         self._size = value
-        self.mini_font = pygame.font.SysFont(
+        self.mini_font = UI.get_font(
             '', round(12 * GLOBALS['HEIGHT'] / 1000 * 20 / self.size))
-        self.font = pygame.font.SysFont(
+        self.font = UI.get_font(
             '', round(48 * GLOBALS['HEIGHT'] / 1000 * 20 / self.size))
         self.tile_size = GLOBALS['HEIGHT'] // self._size
         self.generate()
 
     def generate(self):
+        # a running search would keep pushing cell indices of the old grid
+        if self.search_running():
+            self.stop_search()
+        self.stop_flow()
+        self.board = None
+        self.pending_size = None
+        self.events.discard()
+        while len(self.tile_pool) < self.size * self.size:
+            self.tile_pool.append(Tile(
+                0, 0, 0, font=self.font, font_color=GLOBALS['BOARD_FONT_COLOR'], on_paint=self.tile_painted))
+
+        blank_text = self.font.render('', True, GLOBALS['BOARD_FONT_COLOR'])
         self.tiles.clear()
         for x in range(self.size):
-            line = []
-            for y in range(self.size):
-                tile = Tile(
-                    x * self.tile_size,
-                    y * self.tile_size,
-                    self.tile_size,
-                    font=self.font,
-                    font_color=GLOBALS['BOARD_FONT_COLOR'])
-                line.append(tile)
+            line = self.tile_pool[x * self.size:(x + 1) * self.size]
+            for y, tile in enumerate(line):
+                tile.reposition(x * self.tile_size, y * self.tile_size, self.tile_size, self.font, blank_text)
             self.tiles.append(line)
 
+    def method_text(self) -> str:
+        method = self.path_algs[self.path_alg_indx]
+        if method == self.weighted_a_star:
+            return f'Method: {method.__name__} e={GLOBALS["EPSILON"]}'
+        if method == self.anytime_a_star:
+            return f'Method: {method.__name__} {GLOBALS["SEARCH_TIME_BUDGET"]}s'
+        return f'Method: {method.__name__}'
+
+    def search_options(self, method=None, diagonally=None) -> dict:
+        # extra engine arguments of a method (by name), the current one by default;
+        # called on the main thread once per search, it refreshes the board and its landmarks
+        method = method or self.path_algs[self.path_alg_indx].__name__
+        options = {}
+        if method in ('a_star', 'weighted_a_star', 'greedy', 'anytime_a_star', 'ida_star', 'fringe_search'):
+            if diagonally is None:
+                diagonally = GLOBALS['DIAGONALLY']
+            options['landmarks'] = self.get_landmarks(self.engine_board(), diagonally)
+        if method == 'weighted_a_star':
+            options['weight'] = 1 + GLOBALS['EPSILON']
+        if method == 'anytime_a_star':
+            options['budget'] = GLOBALS['SEARCH_TIME_BUDGET']
+        if method == 'ida_star':
+            options['max_nodes'] = GLOBALS['IDA_MAX_NODES']
+        return options
+
+    def search_running(self) -> bool:
+        return self.t.is_alive() or bool(self.worker and self.worker.busy)
+
+    def next_step(self):
+        self.wait_for_keypress = False
+        if self.worker:
+            self.worker.step()
+
+    def close(self):
+        # nothing drains the events after this, a thread waiting for room would never end
+        if self.search_running():
+            self.stop_search()
+        self.board_button_manager.close()
+        self.stop_race()
+        if self.worker:
+            self.worker.close()
+            self.worker = None
+
+    def tile_painted(self, tile):
+        index = self.tile_index(tile)
+        cell = engine.TILE_TYPES.get(tile.tile_type, engine.EMPTY)
+        if self.flow:
+            self.flow.update_cell(index, cell)  # the field shares self.board
+        elif self.board:
+            self.board.set_cell(index, cell)
+
+    def engine_board(self):
+        # refreshes the cells of the kept board, its graphs only patch what changed
+        board = engine.Board.from_tiles(self.tiles)
+        if self.board is None or self.board.size != board.size:
+            self.board = board
+        else:
+            self.board.cells[:] = board.cells
+        return self.board
+
     def reset(self):
+        self.stop_flow()
         if self.t.is_alive():
             self.skip_waiting = True
+            self.cancel_token.cancel()
+            return
+        if self.worker and self.worker.busy:
+            self.worker.cancel()
             return
 
+        self.events.discard()
         for line in self.tiles:
             for tile in line:
                 tile.text = ''
                 if 'VISITED' in tile.tile_type or tile.tile_type == 'PATH':
                     tile.tile_type = ''
 
+    def load_pending_board(self):
+        if not self.pending_board:
+            return
+        board_name, self.pending_board = self.pending_board, None
+        try:
+            self.load_board(board_name)
+        except FileNotFoundError as e:
+            print(f"There is no {board_name} board!")
+
     def load_board(self, board_name):
         self.board_name_input.current_text = board_name
-        with open(f'boards/{board_name}.pth', 'r') as board:
-            content = board.readlines()
-            self.size = int(content.pop(0))
-            p = re.compile(
-                r'Tile\((?P<x>[0-9]+), (?P<y>[0-9]+), (?P<tile_type>[A-Z]+)\)')
-            for tile in content:
-                m = p.match(tile)
-                self.tiles[int(m.group('x'))][int(m.group('y'))
-                                              ].tile_type = m.group('tile_type')
+        board = engine.Board.from_file(f'boards/{board_name}.pth')
+        self.apply_board(board)
+        self.landmarks = engine.Landmarks.load(f'boards/{board_name}.alt', board)
+
+    def get_landmarks(self, board, diagonally=None):
+        # landmarks are recomputed when the walls changed since they were made
+        if diagonally is None:
+            diagonally = GLOBALS['DIAGONALLY']
+        if self.landmarks is None or not self.landmarks.matches(board, diagonally):
+            started = time.perf_counter()
+            self.landmarks = engine.Landmarks(board, GLOBALS['LANDMARKS'], diagonally)
+            print(f'Computed {len(self.landmarks.landmarks)} landmarks in {time.perf_counter() - started:.3f}s')
+        return self.landmarks
+
+    def apply_board(self, board):
+        self.size = board.size
+        for i, cell in enumerate(board.cells):
+            if cell != engine.EMPTY:
+                x, y = divmod(i, self.size)
+                self.tiles[x][y].tile_type = engine.CELL_TYPES[cell]
 
     def save_board(self, filename):
         with open(f'boards/{filename}.pth', 'w') as board:
             board.write(str(self.size) + '\n')
             for line in self.tiles:
                 for tile in line:
-                    if tile.tile_type == 'BLOCK' or tile.tile_type == 'TARGET':
+                    if tile.tile_type in ('BLOCK', 'TARGET', 'AGENT'):
                         board.write(str(tile) + "\n")
+        # keep the landmark distances next to the board
+        self.get_landmarks(self.engine_board()).save(f'boards/{filename}.alt')
+
+    def stop_search(self):
+        # cancels the running search and waits until it has stopped
+        self.skip_waiting = True
+        self.cancel_token.cancel()
+        self.t.join()
+        if self.worker and self.worker.busy:
+            self.worker.cancel()
+            self.worker.poll(timeout=None)
 
     def find_path(self):
-        if self.t.is_alive():
-            return
+        if self.search_running():
+            self.stop_search()
         self.reset()
+        if self.path_algs[self.path_alg_indx] == self.flow_field:
+            self.flow_field()
+            return
 
         t_blocks = []
         for line in self.tiles:
@@ -451,59 +831,273 @@ class Game:
             return
 
         self.skip_waiting = False
+        self.cancel_token = engine.CancelToken()
+        self.engine_board()
+        # the search thread's own a_star always moves diagonally
+        method = self.path_algs[self.path_alg_indx]
+        thread_a_star = method == self.a_star and not GLOBALS['SEARCH_IN_PROCESS']
+        self.options = self.search_options(diagonally=True if thread_a_star else None)
         start, end = t_blocks
         print(f'Seaching path from: {start} to {end}...')
-        self.t = threading.Thread(target=self.path_algs[self.path_alg_indx],
-                                  args=(start, end))
+        if GLOBALS['SEARCH_IN_PROCESS']:
+            self.start_worker_search(start, end)
+            return
+        self.t = threading.Thread(target=self.run_search,
+                                  args=(self.path_algs[self.path_alg_indx], start, end))
         self.t.start()
 
+    def run_search(self, method, start, end):
+        # body of the search thread
+        method(start, end)
+        self.events.finish(self.cancel_token)
+
+    def flow_field(self):
+        goals = []
+        agents = []
+        for line in self.tiles:
+            for tile in line:
+                if tile.tile_type == 'TARGET':
+                    goals.append(tile)
+                elif tile.tile_type == 'AGENT':
+                    agents.append(tile)
+        if len(goals) != 1 or not agents:
+            print('Make sure, amount of TARGET-type blocks == 1 and there are AGENT-type blocks (A + LMB)')
+            return
+
+        started = time.perf_counter()
+        self.flow = engine.FlowField(
+            self.engine_board(), self.tile_index(goals[0]), GLOBALS['DIAGONALLY'])
+        print(f'Flow field computed in {time.perf_counter() - started:.4f}s for {len(agents)} agents')
+        self.agents = [[self.tile_index(tile)] * 2 for tile in agents]
+        self.agent_time = 0.0
+
+    def stop_flow(self):
+        self.flow = None
+        self.agents = []
+
+    def move_agents(self, dt):
+        self.agent_time += dt / 1000
+        while self.agent_time >= GLOBALS['AGENT_STEP_TIME']:
+            self.agent_time -= GLOBALS['AGENT_STEP_TIME']
+            for agent in self.agents:
+                agent[0] = agent[1]
+                x, y = divmod(agent[0], self.size)
+                if self.tiles[x][y].tile_type == '':
+                    self.tiles[x][y].tile_type = 'PATH'
+                if (next_cell := self.flow.next(agent[0])) != -1:
+                    agent[1] = next_cell
+
+    def draw_agents(self, surface):
+        # agents glide between cells, so hundreds of them stay readable
+        progress = min(1.0, self.agent_time / GLOBALS['AGENT_STEP_TIME'])
+        half = self.tile_size / 2
+        for a, b in self.agents:
+            ax, ay = divmod(a, self.size)
+            bx, by = divmod(b, self.size)
+            pygame.draw.circle(
+                surface,
+                GLOBALS['AGENT_COLOR'],
+                ((ax + (bx - ax) * progress) * self.tile_size + half,
+                 (ay + (by - ay) * progress) * self.tile_size + half),
+                max(2.0, self.tile_size / 3)
+            )
+
+    def start_race(self) -> bool:
+        # every method of RACE_ALGORITHMS searches a copy of the board in its own process
+        board = self.engine_board()
+        targets = board.targets()
+        if len(targets) != 2:
+            print('Make sure, amount of TARGET-type blocks == 2')
+            return False
+        self.stop_race()
+
+        methods = [name for name in GLOBALS['RACE_ALGORITHMS'] if name in engine.ALGORITHMS]
+        spacing = 25
+        pane_size = min((GLOBALS['WIDTH'] - spacing) // len(methods) - spacing, GLOBALS['HEIGHT'] - 250)
+        palette = [GLOBALS[f'TILE_COLOR_TYPE_{cell_type or "DEFAULT"}'] for cell_type in engine.CELL_TYPES] + \
+                  [GLOBALS[f'TILE_COLOR_TYPE_{mark_type or "DEFAULT"}'] for mark_type in engine.MARK_TYPES]
+        for i, method in enumerate(methods):
+            search_worker = worker.SearchWorker(board.size)
+            search_worker.start(board, method, *targets, diagonally=GLOBALS['DIAGONALLY'],
+                                **self.search_options(method))
+            self.race_panes.append(UI.RacePane(
+                spacing + i * (pane_size + spacing), spacing, pane_size, method, search_worker,
+                palette, font_color=GLOBALS['TILE_BORDER_COLOR']))
+        print(f'Racing {", ".join(methods)}')
+        return True
+
+    def stop_race(self):
+        for pane in self.race_panes:
+            pane.worker.close()
+        self.race_panes.clear()
+
+    def tile_index(self, tile) -> int:
+        return tile.x // tile.size * self.size + tile.y // tile.size
+
+    def start_worker_search(self, start, end):
+        if self.worker and self.worker.size != self.size:
+            self.worker.close()
+            self.worker = None
+        if not self.worker:
+            self.worker = worker.SearchWorker(self.size)
+        self.worker_end = end
+        self.worker_marks = bytearray(self.size * self.size)  # marks already shown
+        self.worker.start(
+            self.engine_board(),
+            self.path_algs[self.path_alg_indx].__name__,
+            self.tile_index(start),
+            self.tile_index(end),
+            diagonally=GLOBALS['DIAGONALLY'],
+            pause_time=GLOBALS['PAUSE_TIME'],
+            wait_for_step=GLOBALS['WAIT_FOR_KEYPRESS'],
+            path_draw_time=GLOBALS['PATH_DRAW_TIME'],
+            measure_memory=GLOBALS['MEASURE_MEMORY'],
+            **self.options
+        )
+
+    def sync_worker(self):
+        # read the shared marks in place and update only the tiles that changed
+        result = self.worker.poll()
+        marks = self.worker.marks
+        shown = self.worker_marks
+        for i in range(len(shown)):
+            if marks[i] != shown[i]:
+                shown[i] = marks[i]
+                x, y = divmod(i, self.size)
+                self.tiles[x][y].mark(engine.MARK_TYPES[marks[i]])
+
+        if result is None:
+            return
+        self.report(result)
+        if result.status == 'no path':
+            self.worker_end.text = '-1'
+        for distance, i in enumerate(result.path[1:], 1):
+            x, y = divmod(i, self.size)
+            self.tiles[x][y].text = distance
+
+    def report(self, result):
+        if result.status in ('cancelled', 'timeout'):
+            print(f'Search {result.status}')
+        if result.found:
+            print(f'End length: {len(result.path) - 1}, cost: {result.cost}')
+        elif result.status == 'no path':
+            print('Path doesn\'t exist')
+        print(f'Search took {result.elapsed:.4f}s, expanded {result.expanded} nodes')
+        if result.suboptimality is not None:
+            print(f'Path cost is at most {result.suboptimality:.3f}x the optimal cost')
+        if result.peak_nodes is not None:
+            print(f'At most {result.peak_nodes} nodes were kept in memory')
+        if result.peak_bytes is not None:
+            print(f'Peak memory of the search: {result.peak_bytes / 1024:.1f} KiB')
+
+    def run_engine(self, algorithm, start, end, **options):
+        # runs a headless engine search in the search thread, marking the tiles as it goes
+        def step():
+            time.sleep(GLOBALS['PAUSE_TIME'])
+            if GLOBALS['WAIT_FOR_KEYPRESS']:
+                while self.wait_for_keypress and not self.skip_waiting:
+                    continue
+                self.wait_for_keypress = True
+            return False
+
+        shown_path = []
+
+        def show_solution(result):
+            # anytime searches show every improved path right away
+            for index in shown_path:
+                self.events.push(index, 'VISITED')
+            shown_path[:] = result.path[1:-1]
+            for index in shown_path:
+                self.events.push(index, 'PATH')
+            print(f'Found a path of cost {result.cost}, at most {result.suboptimality:.3f}x the optimal cost')
+
+        if budget := options.pop('budget', None):
+            options['deadline'] = time.monotonic() + budget
+        if algorithm == engine.anytime_a_star:
+            options['on_solution'] = show_solution
+        result = algorithm(
+            self.board,
+            self.tile_index(start),
+            self.tile_index(end),
+            diagonally=GLOBALS['DIAGONALLY'],
+            marks=TileMarks(self.events),
+            step=step,
+            token=self.cancel_token,
+            **options
+        )
+        self.report(result)
+        if result.status == 'no path':
+            self.events.push(self.tile_index(end), label='-1')
+
+        # draw the path from the end, numbering its waypoints
+        cells = engine.path_cells(self.board, result.path, GLOBALS['DIAGONALLY'])
+        waypoints = {index: number for number, index in enumerate(result.path)}
+        for distance in range(len(cells) - 1, 0, -1):
+            if self.cancel_token.cancelled:
+                break
+            state = 'PATH' if distance < len(cells) - 1 else None
+            self.events.push(cells[distance], state, waypoints.get(cells[distance]))
+            time.sleep(GLOBALS['PATH_DRAW_TIME'] / len(cells))
+
+    def weighted_a_star(self, start, end):
+        self.run_engine(engine.weighted_a_star, start, end, **self.options)
+
+    def greedy(self, start, end):
+        self.run_engine(engine.greedy, start, end, **self.options)
+
+    def anytime_a_star(self, start, end):
+        self.run_engine(engine.anytime_a_star, start, end, **self.options)
+
+    def ida_star(self, start, end):
+        self.run_engine(engine.ida_star, start, end, **self.options)
+
+    def fringe_search(self, start, end):
+        self.run_engine(engine.fringe_search, start, end, **self.options)
+
+    def theta_star(self, start, end):
+        self.run_engine(engine.theta_star, start, end, **self.options)
+
     def bfs(self, start, end):
         queue = [start]
         visited = {start: True}
         distance = {start: 0}
         parent = {start: None}
         end_reached = False
+        graph = self.board.graph(GLOBALS['DIAGONALLY'])
 
-        while queue and not end_reached:
+        while queue and not end_reached and not self.cancel_token.cancelled:
             u = queue.pop(0)
-            node_x = u.x // u.size
-            node_y = u.y // u.size
-            for x in range(-1, 2):
-                for y in range(-1, 2):
-                    if abs(x) == abs(y) and not GLOBALS['DIAGONALLY']:
-                        continue
-
-                    if node_x + x in range(self.size):
-                        if node_y + y in range(self.size):
-                            new_node = self.tiles[node_x + x][node_y + y]
-                            if not visited.get(new_node) and new_node.tile_type != "BLOCK":
-                                queue.append(new_node)
-
-                                if new_node != end:
-                                    new_node.tile_type = 'VISITED'
-                                    visited[new_node] = True
-                                else:
-                                    end_reached = True
-
-                                distance[new_node] = distance[u] + 1
-                                parent[new_node] = u
-                                time.sleep(GLOBALS['PAUSE_TIME'])
-                                if GLOBALS['WAIT_FOR_KEYPRESS']:
-                                    while self.wait_for_keypress and not self.skip_waiting:
-                                        continue
-                                    self.wait_for_keypress = True
-
-        if dist := distance[end]:
+            for v, _ in graph.neighbors(self.tile_index(u)):
+                new_node = self.tiles[v // self.size][v % self.size]
+                if not visited.get(new_node):
+                    queue.append(new_node)
+
+                    if new_node != end:
+                        self.events.push(v, 'VISITED')
+                        visited[new_node] = True
+                    else:
+                        end_reached = True
+
+                    distance[new_node] = distance[u] + 1
+                    parent[new_node] = u
+                    time.sleep(GLOBALS['PAUSE_TIME'])
+                    if GLOBALS['WAIT_FOR_KEYPRESS']:
+                        while self.wait_for_keypress and not self.skip_waiting:
+                            continue
+                        self.wait_for_keypress = True
+
+        if self.cancel_token.cancelled:
+            print('Search cancelled')
+            return
+        if dist := distance.get(end):
             print(f'End length: {dist}')
         else:
             print('Path doesn\'t exist')
 
         def enter_and_mark(node):
-            if parent.get(node):
+            if parent.get(node) and not self.cancel_token.cancelled:
                 time.sleep(GLOBALS['PATH_DRAW_TIME']/distance[end])
-                if 'VISITED' in node.tile_type:
-                    node.tile_type = 'PATH'
-                node.text = distance[node]
+                self.events.push(self.tile_index(node), 'PATH' if node is not end else None, distance[node])
 
                 enter_and_mark(parent[node])
         enter_and_mark(end)
@@ -517,74 +1111,45 @@ class Game:
         h = [start]  # priority queue
         end_reached = False
 
-        # preprocess the g_cost for every node
-        # super inefficient, please contribute :DD
-        queue = [end]
-        mini_visited = {}
-        while queue:
-            u = queue.pop(0)
-            node_x = u.x // u.size
-            node_y = u.y // u.size
-            mini_visited[u] = True
-            for x in range(-1, 2):
-                for y in range(-1, 2):
-                    if x != 0 or y != 0:
-                        if node_x + x in range(self.size):
-                            if node_y + y in range(self.size):
-                                new_node = self.tiles[node_x + x][node_y + y]
-                                if not mini_visited.get(new_node) and new_node not in queue:
-                                    queue.append(new_node)
-                                if abs(x) == abs(y):  # diagonal
-                                    if h_cost.get(new_node, -1) == -1 or \
-                                       h_cost[new_node] > h_cost[u] + 14:
-                                        h_cost[new_node] = h_cost[u] + 14
-                                else:
-                                    if h_cost.get(new_node, -1) == -1 or \
-                                       h_cost[new_node] > h_cost[u] + 10:
-                                        h_cost[new_node] = h_cost[u] + 10
-
-        while h and not end_reached:
+        # ALT heuristic, bounded from the distances to the board's landmarks
+        board = self.board
+        landmarks = self.options['landmarks']
+        graph = board.graph(True)
+        end_index = self.tile_index(end)
+
+        while h and not end_reached and not self.cancel_token.cancelled:
             node = h.pop(-1)
-            node_x = node.x // node.size
-            node_y = node.y // node.size
             if node is not start and node is not end:
-                node.tile_type = 'VISITED'
-            for x in range(-1, 2):
-                for y in range(-1, 2):
-                    if x != 0 or y != 0:
-                        if node_x + x in range(self.size):
-                            if node_y + y in range(self.size):
-                                new_node = self.tiles[node_x + x][node_y + y]
-                                if new_node.tile_type != 'BLOCK':
-                                    if not closed.get(new_node) and new_node is not start and new_node is not end:
-                                        new_node.tile_type = 'VISITED_ALTERNATIVE'
-                                        time.sleep(GLOBALS['PAUSE_TIME'])
-                                    if new_node is end:
-                                        end_reached = True
-                                    if abs(x) == abs(y):  # diagonal move
-                                        if g_cost.get(new_node, -1) == -1 or \
-                                           g_cost[new_node] > g_cost[node] + 14:
-                                            g_cost[new_node] = g_cost[node] + 14
-                                            parent[new_node] = node
-                                    else:  # vertical or horizontal move
-                                        if g_cost.get(new_node, -1) == -1 or \
-                                           g_cost[new_node] > g_cost[node] + 10:
-                                            g_cost[new_node] = g_cost[node] + 10
-                                            parent[new_node] = node
-                                    f_cost[new_node] = g_cost[new_node] + h_cost[new_node]
-                                    if GLOBALS['SHOW_ASTAR_VALUES']:
-                                        new_node.font = self.mini_font
-                                        new_node.text = f'{g_cost[new_node]} | {h_cost[new_node]} | {f_cost[new_node]}'
-                                    if not closed.get(new_node):
-                                        closed[new_node] = True
-                                        h.append(new_node)
-                                        h.sort(key=lambda x: -f_cost[x])
+                self.events.push(self.tile_index(node), 'VISITED')
+            for v, cost in graph.neighbors(self.tile_index(node)):  # 14 for diagonal moves, 10 otherwise
+                new_node = self.tiles[v // self.size][v % self.size]
+                if not closed.get(new_node) and new_node is not start and new_node is not end:
+                    self.events.push(v, 'VISITED_ALTERNATIVE')
+                    time.sleep(GLOBALS['PAUSE_TIME'])
+                if new_node is end:
+                    end_reached = True
+                if g_cost.get(new_node, -1) == -1 or g_cost[new_node] > g_cost[node] + cost:
+                    g_cost[new_node] = g_cost[node] + cost
+                    parent[new_node] = node
+                if new_node not in h_cost:
+                    h_cost[new_node] = landmarks.heuristic(board, v, end_index)
+                f_cost[new_node] = g_cost[new_node] + h_cost[new_node]
+                if GLOBALS['SHOW_ASTAR_VALUES']:
+                    self.events.push(v, label=(g_cost[new_node], h_cost[new_node], f_cost[new_node]))
+                if not closed.get(new_node):
+                    closed[new_node] = True
+                    h.append(new_node)
+                    h.sort(key=lambda x: -f_cost[x])
 
             if GLOBALS['WAIT_FOR_KEYPRESS']:
                 while self.wait_for_keypress and not self.skip_waiting:
                     continue
                 self.wait_for_keypress = True
 
+        if self.cancel_token.cancelled:
+            print('Search cancelled')
+            return
+
         path_tiles = []
 
         def draw_path(node):
@@ -597,16 +1162,17 @@ class Game:
             # path extists
             draw_path(parent[end])
             print(f'End length: {len(path_tiles) + 1}')
-            end.text = len(path_tiles) + 1
+            self.events.push(end_index, label=len(path_tiles) + 1)
         else:
             # path doesn't exist
             print("Path doesn\'t exist")
-            end.text = "-1"
+            self.events.push(end_index, label='-1')
 
         for i, tile in enumerate(path_tiles):
-            tile.tile_type = 'PATH'
-            if not GLOBALS['SHOW_ASTAR_VALUES']:
-                tile.text = len(path_tiles) - i
+            if self.cancel_token.cancelled:
+                break
+            label = None if GLOBALS['SHOW_ASTAR_VALUES'] else len(path_tiles) - i
+            self.events.push(self.tile_index(tile), 'PATH', label)
             time.sleep(GLOBALS['PATH_DRAW_TIME']/len(path_tiles))
 
 
@@ -614,6 +1180,7 @@ def main():
     run = True
     clock = pygame.time.Clock()
     game1 = Game(20)
+    first_frame = True
     while run:
         dt = clock.tick(GLOBALS['FPS'])
         events = pygame.event.get()
@@ -631,13 +1198,20 @@ def main():
                     game1.reset()
 
                 if event.key == pygame.K_n:
-                    game1.wait_for_keypress = False
+                    game1.next_step()
 
         win.fill(GLOBALS['BACKGROUND_COLOR'])
         game1.update(pygame.key.get_pressed(), pygame.mouse, dt, events)
         game1.draw(win)
         pygame.display.flip()
 
+        if first_frame:
+            first_frame = False
+            print(f'Time to first frame: {time.perf_counter() - STARTUP_TIME:.3f}s')
+            game1.load_pending_board()
+
+    game1.close()
+
 
 if __name__ == "__main__":
     GLOBALS['WIDTH'] = int(GLOBALS['WIDTH'] * GLOBALS['WINDOW_SCALE'])
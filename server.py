@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import functools
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import engine
+
+with open('variables.json') as json_file:
+    GLOBALS = json.load(json_file)
+
+
+class BoardCache:
+    """LRU of parsed boards (and their landmarks), read from `folder` on a miss."""
+
+    def __init__(self, folder, capacity=64, on_evict=None):
+        self.folder = folder
+        self.capacity = capacity
+        self.boards = OrderedDict()  # name -> (Board, Landmarks or None)
+        self.on_evict = on_evict  # called with the name of every board dropped from the cache
+
+    def preload(self):
+        names = sorted(os.path.splitext(file)[0] for file in os.listdir(self.folder)
+                       if file.endswith('.pth'))
+        for name in names[:self.capacity]:
+            self.get(name)
+        return len(self.boards)
+
+    def get(self, name):
+        if name in self.boards:
+            self.boards.move_to_end(name)
+            return self.boards[name]
+        if os.path.basename(name) != name:
+            raise KeyError(name)
+        try:
+            board = engine.Board.from_file(f'{self.folder}/{name}.pth')
+        except FileNotFoundError:
+            raise KeyError(name)
+        landmarks = engine.Landmarks.load(f'{self.folder}/{name}.alt', board)
+        self.boards[name] = (board, landmarks)
+        if len(self.boards) > self.capacity:
+            evicted, _ = self.boards.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted)
+        return self.boards[name]
+
+    def edit(self, name, changes):
+        # changes are [x, y, tile_type] deltas, applied to the cached copy only,
+        # and only when every one of them is valid; returns them as (index, cell)
+        board, landmarks = self.get(name)
+        deltas = []
+        for x, y, tile_type in changes:
+            if tile_type not in engine.TILE_TYPES:
+                raise RequestError(400, f'Unknown tile type {tile_type!r}, use one of {list(engine.TILE_TYPES)}')
+            deltas.append((_index(board, [x, y]), engine.TILE_TYPES[tile_type]))
+        self.apply(name, deltas)
+        return deltas
+
+    def apply(self, name, deltas):
+        board, landmarks = self.get(name)
+        for index, cell in deltas:
+            board.set_cell(index, cell)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _index(board, point) -> int:
+    x, y = point
+    if not (isinstance(x, int) and isinstance(y, int) and 0 <= x < board.size and 0 <= y < board.size):
+        raise RequestError(400, f'{point} is outside the {board.size}x{board.size} board')
+    return board.index(x, y)
+
+
+# state of a search process: its copy of the boards, the queue of board
+# changes the server sends to it and the number of the last change applied
+_cache = None
+_changes = None
+_applied = 0
+
+
+def _init_process(folder, names, slots, queues):
+    global _cache, _changes
+    # the server's cache decides what is dropped, so this one never evicts
+    _cache = BoardCache(folder, math.inf)
+    _changes = queues[slots.get()]
+    for name in names:
+        _cache.get(name)
+
+
+def _search(name, changed, query):
+    # runs in a search process, first catching up with the first `changed` board changes;
+    # a process started late replays them all, its boards are read from the files as well
+    global _applied
+    while _applied < changed:
+        _applied, (kind, board_name, deltas) = _changes.get()
+        if kind == 'edit':
+            _cache.apply(board_name, deltas)
+        else:
+            _cache.boards.pop(board_name, None)
+    board, landmarks = _cache.get(name)
+    return find_path(board, landmarks, query)
+
+
+def find_path(board, landmarks, query):
+    algorithm = engine.ALGORITHMS[query.get('algorithm', 'a_star')]
+    options = {'diagonally': bool(query.get('diagonally', True))}
+    if algorithm in (engine.a_star, engine.weighted_a_star, engine.greedy, engine.anytime_a_star,
+                     engine.ida_star, engine.fringe_search):
+        options['landmarks'] = landmarks
+    if algorithm in (engine.weighted_a_star, engine.anytime_a_star) and 'weight' in query:
+        options['weight'] = float(query['weight'])
+    if algorithm == engine.ida_star and 'max_nodes' in query:
+        options['max_nodes'] = int(query['max_nodes'])
+    options['deadline'] = time.monotonic() + float(query['budget'])
+    if query.get('measure_memory'):
+        algorithm = functools.partial(engine.measure_memory, algorithm)
+    result = algorithm(board, board.index(*query['start']), board.index(*query['end']), **options)
+    return {
+        'found': result.found,
+        'status': result.status,
+        'path': [board.coords(i) for i in result.path],
+        'cost': result.cost,
+        'expanded': result.expanded,
+        'elapsed': result.elapsed,
+        'suboptimality': result.suboptimality,
+        'peak_nodes': result.peak_nodes,
+        'peak_bytes': result.peak_bytes,
+    }
+
+
+class PathServer:
+    """Answers path queries over HTTP/JSON.
+
+    POST /path  {"board", "start": [x, y], "end": [x, y], "algorithm", "diagonally",
+                 "weight", "budget" (seconds), "max_nodes", "measure_memory"}
+    POST /edit  {"board", "set": [[x, y, tile_type], ...]}
+    GET  /boards
+
+    Searches are CPU bound, so they run in a pool of processes and a slow
+    one doesn't hold up the other connections; queries without a budget get
+    `budget` seconds. Every process keeps its own copy of the cached boards,
+    edits and evictions are sent to all of them once, numbered, and a query
+    carries the number of changes its process has to apply before searching.
+    """
+
+    def __init__(self, cache, processes=None, budget=10.0):
+        self.cache = cache
+        self.budget = budget
+        if processes is None:
+            processes = max(2, os.cpu_count() or 1)  # so one slow search never holds up the rest
+        self.changed = 0
+        self.queues = [multiprocessing.Queue() for _ in range(processes)]
+        slots = multiprocessing.Queue()
+        for i in range(processes):
+            slots.put(i)
+        cache.on_evict = lambda name: self.broadcast('drop', name)
+        self.pool = ProcessPoolExecutor(processes, initializer=_init_process,
+                                        initargs=(cache.folder, list(cache.boards), slots, self.queues))
+
+    def broadcast(self, kind, name, deltas=None):
+        self.changed += 1
+        for queue in self.queues:
+            queue.put((self.changed, (kind, name, deltas)))
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        for queue in self.queues:
+            queue.cancel_join_thread()  # changes nobody will read don't hold up the exit
+
+    async def find_path(self, query):
+        # everything that can be a client error is checked here, before the search process
+        name = query['board']
+        try:
+            board, _ = self.cache.get(name)
+        except KeyError:
+            raise RequestError(404, f'There is no board {query.get("board")}')
+        if query.get('algorithm', 'a_star') not in engine.ALGORITHMS:
+            raise RequestError(400, f'Unknown algorithm, use one of {list(engine.ALGORITHMS)}')
+        _index(board, query['start'])
+        _index(board, query['end'])
+        query.setdefault('budget', self.budget)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, _search, name, self.changed, query)
+
+    def edit(self, query):
+        try:
+            deltas = self.cache.edit(query['board'], query.get('set', []))
+            board, _ = self.cache.get(query['board'])
+        except KeyError:
+            raise RequestError(404, f'There is no board {query.get("board")}')
+        except (TypeError, ValueError):
+            raise RequestError(400, 'Edits have to be [x, y, tile_type] lists')
+        self.broadcast('edit', query['board'], deltas)
+        return {'board': query['board'], 'size': board.size}
+
+    async def handle(self, method, target, body):
+        if method == 'GET' and target == '/boards':
+            return {'boards': list(self.cache.boards)}
+        if method != 'POST' or target not in ('/path', '/edit'):
+            raise RequestError(404, f'No route for {method} {target}')
+        try:
+            query = json.loads(body)
+            if target == '/path':
+                return await self.find_path(query)
+            return self.edit(query)
+        except (ValueError, KeyError, TypeError) as e:
+            raise RequestError(400, f'Bad request: {e!r}')
+
+    async def serve_client(self, reader, writer):
+        # HTTP/1.1 with keep-alive, one request at a time per connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, response = 200, await self.handle(method, target, body)
+                except RequestError as e:
+                    status, response = e.status, {'error': str(e)}
+                payload = json.dumps(response).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, unix, server):
+    if unix:
+        listener = await asyncio.start_unix_server(server.serve_client, path=unix)
+        print(f'Serving paths on {unix}')
+    else:
+        listener = await asyncio.start_server(server.serve_client, host, port)
+        print(f'Serving paths on http://{host}:{port}')
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve path queries for the boards folder over HTTP/JSON')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this unix socket instead of TCP')
+    parser.add_argument('--folder', default=GLOBALS['BOARDS_FOLDER'])
+    parser.add_argument('--cache', type=int, default=64, help='how many parsed boards to keep')
+    parser.add_argument('--processes', type=int, default=None, help='search processes, one per CPU (at least 2) by default')
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='seconds a search may take when the query has no budget')
+    args = parser.parse_args()
+
+    cache = BoardCache(args.folder, args.cache)
+    print(f'Preloaded {cache.preload()} boards')
+    server = PathServer(cache, args.processes, args.budget)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,32 @@
 import pygame
-import re
 import os
 import string
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import engine
 
 pygame.font.init()
 
-DEFAULT_FONT = pygame.font.SysFont('', 28)
-DEFAULT_MINI_FONT = pygame.font.SysFont('', 14)
-DEFAULT_MONOSPACE_FONT = pygame.font.SysFont('monospace', 22, True)
+# fonts are described as (name, size, bold) and created on first use
+DEFAULT_FONT = ('', 28, False)
+DEFAULT_MINI_FONT = ('', 14, False)
+DEFAULT_MONOSPACE_FONT = ('monospace', 22, True)
 DEFAULT_FONT_COLOR = (255, 255, 255)
 
+_font_cache = {}
+
+
+def get_font(name, size, bold=False):
+    # SysFont does a system font lookup every call, so share one font per (name, size, bold)
+    key = (name, size, bold)
+    font = _font_cache.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size, bold)
+        _font_cache[key] = font
+    return font
+
 
 class Label:
     def __init__(self, x, y, text, width=0, height=0, **kwargs):
@@ -18,7 +35,7 @@ class Label:
         self.width = width
         self.height = height
 
-        self.font = kwargs.get('font', DEFAULT_FONT)
+        self.font = kwargs.get('font') or get_font(*DEFAULT_FONT)
         self.font_color = kwargs.get('font_color', DEFAULT_FONT_COLOR)
 
         self.text_anchor_x = kwargs.get('text_anchor_x', 'center')
@@ -136,109 +153,203 @@ class Button(Label):
 
 
 class BoardButtonManager:
-    def __init__(self, game, boards_folder, board_size_px=200):
-        self.boards = []
-        self.board_size_px = board_size_px
+    """Scrollable gallery of the boards in `boards_folder`.
+
+    Previews are only built for the rows that are on screen; the boards are
+    parsed and drawn in a thread pool, and a placeholder is shown until the
+    preview is ready.
+    """
+
+    def __init__(self, game, boards_folder, width, height, tile_colors, border_color,
+                 board_size_px=200, spacing=25, threads=4):
         self.game = game
         self.boards_folder = boards_folder
-        self.load_boards()
-
-    def load_board(self, board_name):
-        import path
-        with open(f'{self.boards_folder}/{board_name}.pth', 'r') as board:
-            content = board.readlines()
-            size = int(content.pop(0))
-
-            # generate tiles
-            tile_size = self.board_size_px // size
-            tiles = []
-            for x in range(size):
-                line = []
-                for y in range(size):
-                    tile = path.Tile(x * tile_size, y * tile_size, tile_size)
-                    line.append(tile)
-                tiles.append(line)
-
-            # read tiles from file
-            p = re.compile(
-                r'Tile\((?P<x>[0-9]+), (?P<y>[0-9]+), (?P<tile_type>[A-Z]+)\)')
-            for tile in content:
-                m = p.match(tile)
-                tiles[int(m.group('x'))][int(m.group('y'))
-                                         ].tile_type = m.group('tile_type')
-        return size, tiles
+        self.width = width
+        self.height = height
+        self.tile_colors = tile_colors  # color of every engine cell type
+        self.border_color = border_color
+        self.board_size_px = board_size_px
+        self.spacing = spacing
+        self.columns = max(1, (width - spacing) // (board_size_px + spacing))
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.files = []
+        self.previews = {}  # index in files -> BoardPreview
+        self.pending = {}  # index in files -> Future of the preview surface
+        self.visible = range(0)
+        self.scroll = 0
+        # boards are loaded the first time the gallery is opened
 
     def load_boards(self):
-        self.boards.clear()
-
-        def load_board(button, pressed):
-            self.game.load_board(button.filename)
-            self.game.show_screen_index = 0
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.previews.clear()
+        self.scroll = 0
 
         # check for files
-        files = []
-        for file in os.listdir(self.boards_folder):
-            name, extension = file.split('.')
-            if extension == 'pth':
-                files.append(name)
+        self.files = []
+        for file in sorted(os.listdir(self.boards_folder)):
+            name, extension = os.path.splitext(file)
+            if extension == '.pth':
+                self.files.append(name)
         try:
             # move the default board to the front of the list
-            files.insert(0, files.pop(files.index('default_board')))
+            self.files.insert(0, self.files.pop(self.files.index('default_board')))
         except ValueError as e:
             print("There is no default_board in the folder!")
+        self.update_visible()
+
+    def render_preview(self, board_name):
+        # runs in the thread pool, so it only touches its own surface
+        board = engine.Board.from_file(f'{self.boards_folder}/{board_name}.pth')
+        tile_size = self.board_size_px // board.size
+        if tile_size < 2:
+            # too small for borders, draw one pixel per cell and scale it
+            view = pygame.Surface((board.size, board.size))
+            view.fill(self.tile_colors[engine.EMPTY])
+            for i, cell in enumerate(board.cells):
+                if cell != engine.EMPTY:
+                    view.set_at(board.coords(i), self.tile_colors[cell])
+            return pygame.transform.scale(view, (self.board_size_px, self.board_size_px))
+
+        view = pygame.Surface((self.board_size_px, self.board_size_px))
+        view.fill(self.border_color)
+        for i, cell in enumerate(board.cells):
+            x, y = board.coords(i)
+            pygame.draw.rect(view, self.tile_colors[cell],
+                             (x * tile_size + 1, y * tile_size + 1, tile_size - 1, tile_size - 1))
+        return view
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def row_height(self) -> int:
+        return self.board_size_px + self.spacing
+
+    def max_scroll(self) -> int:
+        rows = (len(self.files) + self.columns - 1) // self.columns
+        return max(0, rows * self.row_height() + self.spacing - self.height)
+
+    def update_visible(self):
+        # create previews for the rows on screen and drop the ones far away
+        first_row = self.scroll // self.row_height()
+        last_row = (self.scroll + self.height) // self.row_height()
+        visible = range(first_row * self.columns,
+                        min(len(self.files), (last_row + 1) * self.columns))
+        keep = range(visible.start - 3 * len(visible), visible.stop + 3 * len(visible))
+
+        for index in list(self.previews):
+            if index not in keep:
+                del self.previews[index]
+                if index in self.pending:
+                    self.pending.pop(index).cancel()
+
+        for index in visible:
+            x = self.spacing + (self.board_size_px + self.spacing) * (index % self.columns)
+            y = self.spacing + self.row_height() * (index // self.columns) - self.scroll
+            if index not in self.previews:
+                self.previews[index] = BoardPreview(
+                    x, y, self.board_size_px, self.files[index], action=self.choose_board)
+                self.pending[index] = self.executor.submit(self.render_preview, self.files[index])
+            else:
+                self.previews[index].place(x, y)
+        self.visible = visible
 
-        board_spacing = self.board_size_px + 25
-        for index, b in enumerate(files):
-            size, tiles = self.load_board(b)
-            self.boards.append(
-                BoardPreview(
-                    50 + board_spacing * (index % 5), 50 + board_spacing * (index // 5),
-                    self.board_size_px,
-                    b,
-                    action=load_board,
-                    elements=tiles
-                )
-            )
+    def choose_board(self, button, pressed):
+        self.game.load_board(button.filename)
+        self.game.show_screen_index = 0
 
     def draw(self, surface):
-        def perform_draw(item):
-            if type(item) == list:
-                for el in item:
-                    perform_draw(el)
-            else:
-                item.draw(surface)
-
-        for item in self.boards:
-            perform_draw(item)
+        surface.set_clip((0, 0, self.width, self.height))
+        for index in self.visible:
+            self.previews[index].draw(surface)
+        surface.set_clip(None)
 
     def update(self, keys, mouse, dt, events):
-        def perform_update(item):
-            if type(item) == list:
-                for el in item:
-                    perform_update(el)
-            else:
-                item.update(keys, mouse, dt, events)
-
-        for item in self.boards:
-            perform_update(item)
+        for event in events:
+            if event.type == pygame.MOUSEWHEEL:
+                self.scroll -= event.y * self.row_height() // 3
+                self.scroll = min(max(0, self.scroll), self.max_scroll())
+                self.update_visible()
+
+        for index in list(self.pending):
+            future = self.pending[index]
+            if future.done():
+                del self.pending[index]
+                try:
+                    self.previews[index].cached_view = future.result()
+                except (OSError, ValueError, AttributeError) as e:
+                    print(f'Could not load board {self.files[index]}: {e}')
+
+        if mouse.get_pos()[1] < self.height:
+            for index in self.visible:
+                self.previews[index].update(keys, mouse, dt, events)
 
 
 class BoardPreview(Button):
-    def __init__(self, x, y, size, filename, action, elements):
+    def __init__(self, x, y, size, filename, action, cached_view=None):
         super().__init__(x, y, width=size, height=size, text=filename, action=action, anchor_x='left', anchor_y='top',
-                         font=pygame.font.SysFont('', 36))
+                         font=get_font('', 36))
         self.text_pos[1] += self.height // 3
         self.filename = filename
-        self.cached_view = pygame.Surface((size, size))
-        for line in elements:
-            for el in line:
-                el.draw(self.cached_view)
+        self.cached_view = cached_view  # shown as a placeholder until it is set
+
+    def place(self, x, y):
+        self.x = x
+        self.y = y
+        self.text = self.text  # recalculates the text position
+        self.text_pos[1] += self.height // 3
 
     def draw(self, surface):
-        surface.blit(self.cached_view, (self.x, self.y))
+        if self.cached_view is None:
+            pygame.draw.rect(surface, self.colors[0], (self.x, self.y, self.width, self.height))
+        else:
+            surface.blit(self.cached_view, (self.x, self.y))
         surface.blit(self.text_obj, self.text_pos)
 
 
+class RacePane:
+    """One method of a race: the board and marks of its SearchWorker with live stats."""
+
+    def __init__(self, x, y, size, name, worker, palette, font_color=DEFAULT_FONT_COLOR):
+        self.x = x
+        self.y = y
+        self.size = size
+        self.name = name
+        self.worker = worker
+        self.palette = palette  # colors of the engine cell types followed by the marks
+        self.font = get_font(*DEFAULT_FONT)
+        self.font_color = font_color
+        self.result = None  # SearchResult once the worker is done
+
+    def update(self, keys, mouse, dt, events):
+        if self.result is None:
+            self.result = self.worker.poll()
+
+    def draw(self, surface):
+        # marks are drawn over empty cells, one pixel per cell scaled to the pane
+        n = self.worker.size
+        cells = np.frombuffer(self.worker.cells, dtype=np.uint8)
+        marks = np.frombuffer(self.worker.marks, dtype=np.uint8)
+        view = np.where((marks != engine.UNVISITED) & (cells == engine.EMPTY),
+                        marks + len(engine.CELL_TYPES), cells).reshape(n, n)
+        del cells, marks  # the shared memory can't be closed while they exist
+        image = pygame.surfarray.make_surface(view)
+        image.set_palette(self.palette)
+        surface.blit(pygame.transform.scale(image, (self.size, self.size)), (self.x, self.y))
+
+        if self.result is None:
+            expanded, elapsed = self.worker.progress()
+            status = 'searching...'
+        else:
+            expanded, elapsed = self.result.expanded, self.result.elapsed
+            status = f'cost {self.result.cost}' if self.result.found else self.result.status
+        lines = (self.name, f'{expanded} expanded', f'{elapsed:.4f}s', status)
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, self.font_color),
+                         (self.x, self.y + self.size + 10 + i * self.font.get_linesize()))
+
+
 class TextInput(Label):
     def __init__(self,
                  x, y,
@@ -267,7 +378,7 @@ class TextInput(Label):
 
         super().__init__(x, y, text=placeholder,
                          width=width, height=height,
-                         font=DEFAULT_MONOSPACE_FONT, font_color=inactive_color,
+                         font=get_font(*DEFAULT_MONOSPACE_FONT), font_color=inactive_color,
                          text_anchor_x='left', text_offset_x=outline_width + 3, **kwargs)
         self.background_body = pygame.Surface((self.width, self.height))
         self.outline_width = outline_width
@@ -0,0 +1,169 @@
+import functools
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+import engine
+
+# expanded nodes and seconds of the running search, updated after every expansion
+STATS = struct.Struct('<qd')
+
+
+class SearchWorker:
+    """Runs engine searches in a separate process.
+
+    The board cells and the search marks live in one shared memory block
+    (`size * size` bytes each) followed by the live STATS, so the UI can
+    read them every frame without copying. Commands go over a pipe: ('start', algorithm,
+    start, end, options), ('step',), ('wait', wait_for_step) and ('quit',),
+    and the process answers with
+    ('done', path, cost, expanded, elapsed, status, suboptimality, peak_nodes, peak_bytes).
+    Cancelling goes through a shared event, so it also stops a search that
+    is waiting for a step.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        n = size * size
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * n + STATS.size)
+        self.cells = self.shm.buf[:n]
+        self.marks = self.shm.buf[n:2 * n]
+        self.stats = self.shm.buf[2 * n:2 * n + STATS.size]
+        self.busy = False
+        self.token = engine.CancelToken(multiprocessing.Event())
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(child_conn, self.shm.name, size, self.token.event), daemon=True)
+        self.process.start()
+
+    def start(self, board, algorithm, start, end, **options):
+        if self.busy:
+            return
+        self.cells[:] = board.cells
+        self.marks[:] = bytes(len(self.marks))
+        self.stats[:] = bytes(STATS.size)
+        self.token.reset()
+        self.busy = True
+        self.conn.send(('start', algorithm, start, end, options))
+
+    def step(self):
+        if self.busy:
+            self.conn.send(('step',))
+
+    def set_wait_for_step(self, wait_for_step):
+        if self.busy:
+            self.conn.send(('wait', wait_for_step))
+
+    def cancel(self):
+        if self.busy:
+            self.token.cancel()
+
+    def progress(self) -> tuple[int, float]:
+        # expanded nodes and elapsed seconds of the running (or last) search
+        return STATS.unpack(self.stats)
+
+    def poll(self, timeout=0):
+        # returns the SearchResult once the running search is done
+        if not self.busy or not self.conn.poll(timeout):
+            return None
+        _, path, cost, expanded, elapsed, status, suboptimality, peak_nodes, peak_bytes = self.conn.recv()
+        self.busy = False
+        result = engine.SearchResult(path, cost, expanded, elapsed, status, suboptimality, peak_nodes)
+        result.peak_bytes = peak_bytes
+        return result
+
+    def close(self):
+        if self.process.is_alive():
+            self.cancel()
+            self.conn.send(('quit',))
+            self.process.join(timeout=1)
+        self.cells.release()
+        self.marks.release()
+        self.stats.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _serve(conn, shm_name, size, cancel_event):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    n = size * size
+    board = engine.Board(size, shm.buf[:n])
+    marks = shm.buf[n:2 * n]
+    stats = shm.buf[2 * n:2 * n + STATS.size]
+    token = engine.CancelToken(cancel_event)
+    inbox = []  # commands that arrived during a search and are meant for this loop
+
+    while True:
+        message = inbox.pop(0) if inbox else conn.recv()
+        if message[0] == 'quit':
+            break
+        if message[0] != 'start':
+            continue  # a command for a search that already ended
+        _, algorithm, start, end, options = message
+        result = _run(conn, inbox, board, marks, stats, token, algorithm, start, end, **options)
+        conn.send(('done', result.path, result.cost, result.expanded,
+                   result.elapsed, result.status, result.suboptimality, result.peak_nodes, result.peak_bytes))
+
+    marks.release()
+    stats.release()
+    board.cells.release()
+    shm.close()
+
+
+def _run(conn, inbox, board, marks, stats, token, algorithm, start, end, diagonally=True, pause_time=0,
+         wait_for_step=False, path_draw_time=0, budget=None, measure_memory=False, **search_options):
+    started = time.perf_counter()
+    expanded = 0
+
+    def step():
+        nonlocal wait_for_step, expanded
+        expanded += 1
+        STATS.pack_into(stats, 0, expanded, time.perf_counter() - started)
+        if pause_time:
+            time.sleep(pause_time)
+        # block for a 'step' command in step mode, otherwise only read pending commands
+        while not token.cancelled:
+            if conn.poll(0.01 if wait_for_step else 0):
+                message = conn.recv()
+                if message[0] == 'wait':
+                    wait_for_step = message[1]
+                elif message[0] == 'step':
+                    if wait_for_step:
+                        break
+                else:
+                    inbox.append(message)
+            elif not wait_for_step:
+                break
+        return False
+
+    shown_path = []
+
+    def show_solution(result):
+        # anytime searches show every improved path right away
+        for index in shown_path:
+            marks[index] = engine.VISITED
+        shown_path[:] = result.path[1:-1]
+        for index in shown_path:
+            marks[index] = engine.PATH
+
+    if algorithm == 'anytime_a_star':
+        search_options['on_solution'] = show_solution
+    search = engine.ALGORITHMS[algorithm]
+    if measure_memory:
+        # the process only runs this search, so the traced peak is its own
+        search = functools.partial(engine.measure_memory, search)
+    result = search(
+        board, start, end, diagonally=diagonally, marks=marks, step=step, token=token,
+        deadline=time.monotonic() + budget if budget else None, **search_options)
+    STATS.pack_into(stats, 0, result.expanded, result.elapsed)
+
+    # draw the path from the end, like in the thread mode
+    if result.found and not shown_path:
+        cells = engine.path_cells(board, result.path, diagonally)
+        for index in reversed(cells[1:-1]):
+            if token.cancelled:
+                break
+            marks[index] = engine.PATH
+            time.sleep(path_draw_time / len(cells))
+    return result